@@ -1,48 +1,138 @@
 import os
 import asyncio
+from functools import cache
+from pathlib import Path
 from database import Database
 from dotenv import load_dotenv
-from firecrawl import FirecrawlApp
-from scraper import scrape_product
-from notifications import send_price_alert
+from scraper import get_selector_templates, scrape_product, scrape_products
+from canonical_urls import group_by_canonical
+from fetch_gate import get_gate
+from firecrawl_client import get_client
+from scrape_engine import ScrapeEngine
+from notifications import AlertDispatcher
 
 load_dotenv()
 
-db = Database(os.getenv("POSTGRES_URL"))
-app = FirecrawlApp()
+# "changes" only stores a price when it differs from the product's current
+# price and otherwise records when the current price was last confirmed
+PRICE_STORAGE = os.getenv("PRICE_STORAGE", "all")
 
 # Threshold percentage for price drop alerts (e.g., 5% = 0.05)
 PRICE_DROP_THRESHOLD = 0.05
 
+# Maximum number of products scraped at the same time
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "8"))
+# Number of retries for a product whose scrape fails, on top of the Firecrawl
+# client's own retries of every request
+SCRAPE_MAX_RETRIES = int(os.getenv("SCRAPE_MAX_RETRIES", "0"))
+# "batch" submits products as Firecrawl batch jobs, "concurrent" scrapes
+# them one request per product through the scrape engine
+SCRAPE_MODE = os.getenv("SCRAPE_MODE", "batch")
+# Number of scraped prices buffered before they are written in one transaction
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+# "templates" extracts pages of known domains with learned selectors and only
+# falls back to LLM extraction when that fails, "llm" always uses the LLM
+EXTRACT_MODE = os.getenv("EXTRACT_MODE", "templates")
+# Validators and last extraction of every product page, so pages that did not
+# change since the last run are not extracted again (FETCH_GATE=off disables)
+GATE_PATH = Path(__file__).resolve().parent / "fetch_gate.json"
+
+
+@cache
+def get_db() -> Database:
+    return Database(os.getenv("POSTGRES_URL"), change_only=PRICE_STORAGE == "changes")
+
+
+@cache
+def get_templates():
+    if EXTRACT_MODE != "templates":
+        return None
+    return get_selector_templates(get_db().engine)
+
+
+async def scrape_updates(product_urls, latest_prices):
+    """Yield (url, data, error) for every product using the configured mode"""
+    templates = get_templates()
+    gate = get_gate(GATE_PATH)
+    if SCRAPE_MODE == "batch":
+        results = scrape_products(
+            product_urls,
+            templates=templates,
+            expected_prices=latest_prices,
+            gate=gate,
+        )
+        # Poll the blocking generator in a thread to keep the event loop free
+        while (result := await asyncio.to_thread(next, results, None)) is not None:
+            yield result
+    else:
+        # Products stored under different URLs of the same page are scraped once
+        groups = group_by_canonical(product_urls)
+        engine = ScrapeEngine(
+            lambda url: scrape_product(
+                url, templates, latest_prices.get(groups[url][0]), gate
+            ),
+            concurrency=SCRAPE_CONCURRENCY,
+            max_retries=SCRAPE_MAX_RETRIES,
+        )
+        async for result in engine.run(list(groups)):
+            for url in groups[result.url]:
+                data = None if result.data is None else {**result.data, "url": url}
+                yield url, data, result.error
+        print(engine.summary)
+
 
 async def check_prices():
-    products = db.get_all_products()
-    product_urls = set(product.url for product in products)
-
-    for product_url in product_urls:
-        # Get the price history
-        price_history = db.get_price_history(product_url)
-        if not price_history:
-            continue
-
-        # Get the earliest recorded price
-        earliest_price = price_history[-1].price
-
-        # Retrieve updated product data
-        updated_product = scrape_product(product_url)
-        current_price = updated_product["price"]
-
-        # Add the price to the database
-        db.add_price(updated_product)
-        print(f"Added new price entry for {updated_product['name']}")
-
-        # Check if price dropped below threshold
-        if earliest_price > 0:  # Avoid division by zero
-            price_drop = (earliest_price - current_price) / earliest_price
-            if price_drop >= PRICE_DROP_THRESHOLD:
-                await send_price_alert(
-                    updated_product["name"], earliest_price, current_price, product_url
-                )
+    # Get the earliest and latest recorded price of every product that has a
+    # history
+    db = get_db()
+    summaries = db.get_price_summaries()
+    earliest_prices = {summary.url: summary.first_price for summary in summaries}
+    latest_prices = {summary.url: summary.latest_price for summary in summaries}
+
+    pending_prices = []
+
+    async def flush_prices():
+        # Add the buffered prices to the database in a single transaction
+        if pending_prices:
+            inserted = await asyncio.to_thread(db.add_prices, pending_prices)
+            print(f"Recorded {inserted} new prices")
+            pending_prices.clear()
+
+    # Alerts are queued and sent in the background, up to 10 per message
+    async with AlertDispatcher() as alerts:
+        async for product_url, updated_product, error in scrape_updates(
+            list(earliest_prices), latest_prices
+        ):
+            if error:
+                print(f"Error scraping {product_url}: {error}")
+                continue
+
+            current_price = updated_product["price"]
+
+            pending_prices.append(updated_product)
+            if len(pending_prices) >= WRITE_BATCH_SIZE:
+                await flush_prices()
+
+            # Check if price dropped below threshold
+            earliest_price = earliest_prices[product_url]
+            if earliest_price > 0:  # Avoid division by zero
+                price_drop = (earliest_price - current_price) / earliest_price
+                if price_drop >= PRICE_DROP_THRESHOLD:
+                    alerts.add_price_alert(
+                        updated_product["name"],
+                        earliest_price,
+                        current_price,
+                        product_url,
+                    )
+
+        await flush_prices()
+    print(alerts)
+    print(get_client().stats)
+    if get_gate(GATE_PATH) is not None:
+        get_gate(GATE_PATH).save()
+        print(get_gate(GATE_PATH).stats)
+    if get_templates() is not None:
+        print(get_templates())
 
 
 if __name__ == "__main__":
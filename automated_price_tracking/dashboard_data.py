@@ -0,0 +1,80 @@
+"""
+Cached data access for the Streamlit dashboard.
+
+The database is created once per server process, the product summaries are
+cached until a price is added (or for SUMMARY_TTL seconds, to pick up prices
+written by check_prices), and chart data is cached per product keyed on its
+latest price timestamp, so a new price automatically invalidates its chart.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pandas as pd
+import streamlit as st
+
+from database import Database, PriceSummary
+from rollups import bucket_start, choose_resolution
+
+SUMMARY_TTL = 300
+
+
+@st.cache_resource(show_spinner="Loading database...")
+def get_database() -> Database:
+    return Database(
+        os.getenv("POSTGRES_URL"),
+        change_only=os.getenv("PRICE_STORAGE", "all") == "changes",
+    )
+
+
+@st.cache_data(ttl=SUMMARY_TTL, show_spinner=False)
+def load_summaries() -> list[PriceSummary]:
+    return get_database().get_price_summaries()
+
+
+def invalidate():
+    """Drop cached summaries after prices were added or products changed"""
+    load_summaries.clear()
+
+
+def get_since(window: Optional[timedelta]) -> Optional[datetime]:
+    """Start of a time range, rounded down to the hour so it is cacheable"""
+    if window is None:
+        return None
+    return bucket_start(datetime.utcnow() - window, "hour")
+
+
+def chart_resolution(summary: PriceSummary, since: Optional[datetime]):
+    """Resolution used to chart a product's prices since a point in time"""
+    start = (
+        summary.first_timestamp
+        if since is None
+        else max(since, summary.first_timestamp)
+    )
+    return choose_resolution(summary.latest_timestamp - start)
+
+
+@st.cache_data(show_spinner=False, max_entries=5000)
+def load_chart_data(
+    url: str,
+    resolution: Optional[str],
+    since: Optional[datetime],
+    latest_timestamp: datetime,
+) -> pd.DataFrame:
+    """
+    Load the points of a product's price chart. `latest_timestamp` is only part
+    of the cache key, so the entry is replaced once a newer price exists.
+    """
+    db = get_database()
+    if resolution is None:
+        rows = [
+            {"timestamp": price.timestamp, "price": price.price}
+            for price in db.get_price_histories([url], since).get(url, [])
+        ]
+    else:
+        rows = [
+            {"timestamp": rollup.bucket_start, "price": rollup.close}
+            for rollup in db.get_price_rollups(resolution, [url], since).get(url, [])
+        ]
+    return pd.DataFrame(rows, columns=["timestamp", "price"])
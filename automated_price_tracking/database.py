@@ -1,47 +1,171 @@
-from sqlalchemy import create_engine, Column, String, Float, DateTime, ForeignKey
+from sqlalchemy import (
+    create_engine,
+    insert,
+    select,
+    update,
+    delete,
+    func,
+    case,
+    and_,
+    or_,
+    bindparam,
+    Column,
+    String,
+    Float,
+    Integer,
+    BigInteger,
+    DateTime,
+    ForeignKey,
+    Identity,
+    Index,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
+import bisect
+import sys
 from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple, Optional
+from rollups import aggregate, bucket_start, merge
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared"))
+from schema_upgrades import upgrade_schema
 
 Base = declarative_base()
 
+# Number of rows sent per INSERT batch by Database.add_prices
+ADD_PRICES_BATCH_SIZE = 1000
+
+# Dialects with INSERT ... ON CONFLICT. Others insert after checking which
+# rows already exist, which is slower and not safe against concurrent writers.
+UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+
+# SQLite only auto-increments INTEGER PRIMARY KEY columns
+BigIntegerKey = BigInteger().with_variant(Integer, "sqlite")
+
 
 class Product(Base):
-    __tablename__ = "products"
+    """A tracked product and its most recently scraped details"""
+
+    __tablename__ = "tracked_products"
 
-    url = Column(String, primary_key=True)
+    id = Column(Integer, Identity(), primary_key=True)
+    url = Column(String, nullable=False, unique=True)
+    name = Column(String)
+    currency = Column(String)
+    main_image_url = Column(String)
+    # Scrape time of the details above, so older scrapes never overwrite them
+    updated_at = Column(DateTime)
     prices = relationship(
         "PriceHistory", back_populates="product", cascade="all, delete-orphan"
     )
 
 
 class PriceHistory(Base):
-    __tablename__ = "price_histories"
+    __tablename__ = "product_prices"
+    __table_args__ = (
+        # Serves every history query and makes repeated writes idempotent
+        Index(
+            "ix_product_prices_product_id_timestamp",
+            "product_id",
+            "timestamp",
+            unique=True,
+        ),
+        # Lets "still current at" filters, an OR of both times, use indexes
+        Index(
+            "ix_product_prices_product_id_last_confirmed_at",
+            "product_id",
+            "last_confirmed_at",
+        ),
+    )
 
-    id = Column(String, primary_key=True)
-    product_url = Column(String, ForeignKey("products.url"))
-    name = Column(String, nullable=False)
+    id = Column(BigIntegerKey, Identity(), primary_key=True)
+    product_id = Column(Integer, ForeignKey("tracked_products.id"), nullable=False)
     price = Column(Float, nullable=False)
-    currency = Column(String, nullable=False)
-    main_image_url = Column(String)
     timestamp = Column(DateTime, nullable=False)
+    # Latest scrape that found the same price again, in change-only mode
+    last_confirmed_at = Column(DateTime)
     product = relationship("Product", back_populates="prices")
 
 
+class PriceRollup(Base):
+    """Open/high/low/close of a product's prices over one hour or day"""
+
+    __tablename__ = "product_price_rollups"
+
+    product_id = Column(Integer, ForeignKey("tracked_products.id"), primary_key=True)
+    resolution = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
+    count = Column(Integer, nullable=False)
+    open_timestamp = Column(DateTime, nullable=False)
+    close_timestamp = Column(DateTime, nullable=False)
+    product = relationship("Product")
+
+
+class PriceSummary(NamedTuple):
+    """Latest details and price statistics of a single product"""
+
+    url: str
+    name: str
+    currency: str
+    main_image_url: Optional[str]
+    first_price: float
+    latest_price: float
+    min_price: float
+    max_price: float
+    price_count: int
+    first_timestamp: datetime
+    latest_timestamp: datetime
+
+
+class PricePoint(NamedTuple):
+    """A product's price at one point in time"""
+
+    product_url: str
+    name: str
+    price: float
+    currency: str
+    main_image_url: Optional[str]
+    timestamp: datetime
+
+
 class Database:
-    def __init__(self, connection_string):
+    """
+    Args:
+        connection_string (str): SQLAlchemy database URL
+        change_only (bool): Only store a price when it differs from the
+            product's current price; otherwise record when the current price
+            was last confirmed
+    """
+
+    def __init__(self, connection_string, change_only=False):
+        # No connection is made until the database is first used
         self.engine = create_engine(connection_string)
-        Base.metadata.create_all(self.engine)
         self.Session = sessionmaker(bind=self.engine)
+        self.change_only = change_only
+
+    def setup(self):
+        """
+        Create missing tables and add the columns and indexes introduced after
+        a table was first created. Run once after installing or upgrading, with
+        setup_database.py.
+        """
+        upgrade_schema(self.engine, Base.metadata)
 
     def add_product(self, url):
-        session = self.Session()
-        try:
-            # Create the product entry
-            product = Product(url=url)
-            session.merge(product)  # merge will update if exists, insert if not
-            session.commit()
-        finally:
-            session.close()
+        with self.Session.begin() as session:
+            if self._has_upserts:
+                session.execute(
+                    self._insert(Product.__table__)
+                    .values(url=url)
+                    .on_conflict_do_nothing(index_elements=["url"])
+                )
+            elif session.scalar(select(Product.id).where(Product.url == url)) is None:
+                session.execute(insert(Product.__table__).values(url=url))
 
     def product_exists(self, url):
         session = self.Session()
@@ -50,32 +174,406 @@ class Database:
         finally:
             session.close()
 
+    @property
+    def _has_upserts(self):
+        return self.engine.dialect.name in UPSERT_DIALECTS
+
+    def _insert(self, table):
+        """Build a dialect-specific INSERT that supports ON CONFLICT clauses"""
+        return UPSERT_DIALECTS[self.engine.dialect.name].insert(table)
+
+    def _greatest_least(self):
+        if self.engine.dialect.name == "postgresql":
+            return func.greatest, func.least
+        # SQLite's multi-argument min() and max() are scalar functions
+        return func.max, func.min
+
+    @staticmethod
+    def _parse_timestamp(timestamp):
+        # Convert timestamp string to datetime if it's a string
+        if isinstance(timestamp, str):
+            timestamp = datetime.strptime(timestamp, "%Y-%m-%d %H-%M")
+        return timestamp
+
     def add_price(self, product_data):
+        self.add_prices([product_data])
+
+    def add_prices(self, records, batch_size=ADD_PRICES_BATCH_SIZE):
+        """
+        Insert many prices, creating missing products, in a single transaction.
+
+        Products are upserted with their latest scraped details and prices are
+        sent in batches of `batch_size` with INSERT ... ON CONFLICT DO NOTHING,
+        so a product's price at an already stored timestamp is skipped. On
+        databases without ON CONFLICT, the stored rows are looked up first. In
+        change-only mode, prices equal to the product's current price only move
+        its last_confirmed_at forward. Returns the number of prices recorded.
+        """
+        # Later duplicates of the same product and timestamp are dropped
+        prices, products = {}, {}
+        for product_data in records:
+            timestamp = self._parse_timestamp(product_data["timestamp"])
+            url = product_data["url"]
+            prices.setdefault((url, timestamp), product_data["price"])
+            details = products.get(url)
+            if details is None or timestamp >= details["updated_at"]:
+                products[url] = {
+                    "url": url,
+                    "name": product_data["name"],
+                    "currency": product_data["currency"],
+                    "main_image_url": product_data["main_image_url"],
+                    "updated_at": timestamp,
+                }
+        if not prices:
+            return 0
+
+        products = list(products.values())
+        with self.Session.begin() as session:
+            if self._has_upserts:
+                product_ids = self._upsert_products(session, products, batch_size)
+            else:
+                product_ids = self._merge_products(session, products, batch_size)
+
+            rows = [
+                {
+                    "product_id": product_ids[url],
+                    "price": price,
+                    "timestamp": timestamp,
+                    "last_confirmed_at": None,
+                }
+                for (url, timestamp), price in prices.items()
+            ]
+            confirmed = []
+            if self.change_only:
+                rows, confirmed = self._confirm_unchanged(session, rows, batch_size)
+            if self._has_upserts:
+                inserted = self._insert_prices(session, rows, batch_size)
+            else:
+                inserted = self._insert_new_prices(session, rows, batch_size)
+            # Confirmations count as observations of the price in the rollups
+            self._update_rollups(session, inserted + confirmed, batch_size)
+        return len(inserted) + len(confirmed)
+
+    def _upsert_products(self, session, products, batch_size):
+        """Upsert products with INSERT ... ON CONFLICT, returning ids by URL"""
+        insert_products = self._insert(Product.__table__)
+        new, old = insert_products.excluded, Product.__table__.c
+        is_newer = or_(old.updated_at.is_(None), new.updated_at >= old.updated_at)
+        # Always "update" on conflict so RETURNING yields the id of every product
+        upsert_products = insert_products.on_conflict_do_update(
+            index_elements=["url"],
+            set_={
+                column: case((is_newer, new[column]), else_=old[column])
+                for column in ("name", "currency", "main_image_url", "updated_at")
+            },
+        ).returning(Product.id, Product.url)
+        product_ids = {}
+        for i in range(0, len(products), batch_size):
+            result = session.execute(upsert_products, products[i : i + batch_size])
+            product_ids.update((row.url, row.id) for row in result)
+        return product_ids
+
+    def _merge_products(self, session, products, batch_size):
+        """
+        Upsert products without ON CONFLICT: update the stored ones the
+        details are newer for, insert the rest, then read back the ids by URL
+        """
+        table = Product.__table__
+        product_ids = {}
+        for i in range(0, len(products), batch_size):
+            batch = products[i : i + batch_size]
+            stored = {
+                row.url: row
+                for row in session.execute(
+                    select(table.c.id, table.c.url, table.c.updated_at).where(
+                        table.c.url.in_([product["url"] for product in batch])
+                    )
+                )
+            }
+            updates = [
+                {**product, "id": stored[product["url"]].id}
+                for product in batch
+                if product["url"] in stored
+                and (
+                    stored[product["url"]].updated_at is None
+                    or product["updated_at"] >= stored[product["url"]].updated_at
+                )
+            ]
+            if updates:
+                session.execute(update(Product), updates)
+            new = [product for product in batch if product["url"] not in stored]
+            if new:
+                session.execute(insert(table), new)
+            product_ids.update({url: row.id for url, row in stored.items()})
+            if new:
+                product_ids.update(
+                    session.execute(
+                        select(table.c.url, table.c.id).where(
+                            table.c.url.in_([product["url"] for product in new])
+                        )
+                    ).all()
+                )
+        return product_ids
+
+    def _insert_prices(self, session, rows, batch_size):
+        """Insert prices with ON CONFLICT DO NOTHING, returning the inserted"""
+        insert_prices = (
+            self._insert(PriceHistory.__table__)
+            .on_conflict_do_nothing(index_elements=["product_id", "timestamp"])
+            .returning(
+                PriceHistory.product_id, PriceHistory.price, PriceHistory.timestamp
+            )
+        )
+        inserted = []
+        for i in range(0, len(rows), batch_size):
+            result = session.execute(insert_prices, rows[i : i + batch_size])
+            inserted.extend(row._asdict() for row in result)
+        return inserted
+
+    def _insert_new_prices(self, session, rows, batch_size):
+        """
+        Insert the prices not stored yet at their product and timestamp,
+        without ON CONFLICT, returning the inserted
+        """
+        prices = PriceHistory.__table__.c
+        inserted = []
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i : i + batch_size]
+            timestamps = [row["timestamp"] for row in batch]
+            stored = set(
+                session.execute(
+                    select(prices.product_id, prices.timestamp).where(
+                        prices.product_id.in_({row["product_id"] for row in batch}),
+                        prices.timestamp.between(min(timestamps), max(timestamps)),
+                    )
+                ).all()
+            )
+            new = [
+                row
+                for row in batch
+                if (row["product_id"], row["timestamp"]) not in stored
+            ]
+            if new:
+                session.execute(insert(PriceHistory.__table__), new)
+            inserted.extend(
+                {key: row[key] for key in ("product_id", "price", "timestamp")}
+                for row in new
+            )
+        return inserted
+
+    def _confirm_unchanged(self, session, rows, batch_size=ADD_PRICES_BATCH_SIZE):
+        """
+        Fold new price rows that repeat the price of the stored row before them
+        into that row's last_confirmed_at. Prices already covered by a stored
+        row are dropped. Returns the rows that still need to be inserted and
+        the folded rows.
+        """
+        prices = PriceHistory.__table__.c
+        since = min(row["timestamp"] for row in rows)
+        # Seen at or after `since`, written so both time indexes can be used
+        # (last_confirmed_at is never before timestamp)
+        last_seen_since = or_(
+            prices.timestamp >= since, prices.last_confirmed_at >= since
+        )
+        product_ids = list({row["product_id"] for row in rows})
+
+        # Each product's newest row and every row still current within the batch
+        stored = {}
+        for i in range(0, len(product_ids), batch_size):
+            chunk = product_ids[i : i + batch_size]
+            newest = (
+                select(prices.product_id, func.max(prices.timestamp).label("timestamp"))
+                .where(prices.product_id.in_(chunk))
+                .group_by(prices.product_id)
+                .subquery()
+            )
+            query = (
+                select(
+                    prices.id,
+                    prices.product_id,
+                    prices.price,
+                    prices.timestamp,
+                    prices.last_confirmed_at,
+                )
+                .outerjoin(
+                    newest,
+                    and_(
+                        prices.product_id == newest.c.product_id,
+                        prices.timestamp == newest.c.timestamp,
+                    ),
+                )
+                .where(prices.product_id.in_(chunk))
+                .where(or_(newest.c.product_id.is_not(None), last_seen_since))
+                .order_by(prices.product_id, prices.timestamp)
+            )
+            for row in session.execute(query):
+                stored.setdefault(row.product_id, []).append(row._asdict())
+
+        new_rows, confirmed, updates = [], [], {}
+        for row in sorted(rows, key=lambda row: row["timestamp"]):
+            history = stored.setdefault(row["product_id"], [])
+            position = bisect.bisect_right(
+                history, row["timestamp"], key=lambda price: price["timestamp"]
+            )
+            previous = history[position - 1] if position else None
+            if previous is None or row["price"] != previous["price"]:
+                new_rows.append(row)
+                history.insert(position, row)
+            elif row["timestamp"] > (
+                previous["last_confirmed_at"] or previous["timestamp"]
+            ):
+                previous["last_confirmed_at"] = row["timestamp"]
+                confirmed.append(row)
+                if "id" in previous:
+                    updates[previous["id"]] = row["timestamp"]
+
+        confirm = (
+            update(PriceHistory.__table__)
+            .where(prices.id == bindparam("row_id"))
+            .where(
+                or_(
+                    prices.last_confirmed_at.is_(None),
+                    prices.last_confirmed_at < bindparam("confirmed_at"),
+                )
+            )
+            .values(last_confirmed_at=bindparam("confirmed_at"))
+        )
+        updates = [
+            {"row_id": row_id, "confirmed_at": confirmed_at}
+            for row_id, confirmed_at in updates.items()
+        ]
+        for i in range(0, len(updates), batch_size):
+            session.execute(confirm, updates[i : i + batch_size])
+        return new_rows, confirmed
+
+    def _update_rollups(self, session, rows, batch_size=ADD_PRICES_BATCH_SIZE):
+        """Merge newly inserted price rows into the hourly and daily rollups"""
+        rollups = aggregate(rows)
+        if not rollups:
+            return
+        if not self._has_upserts:
+            self._merge_rollups(session, rollups, batch_size)
+            return
+
+        greatest, least = self._greatest_least()
+        insert = self._insert(PriceRollup.__table__)
+        new, old = insert.excluded, PriceRollup.__table__.c
+        upsert = insert.on_conflict_do_update(
+            index_elements=["product_id", "resolution", "bucket_start"],
+            set_={
+                "open": case(
+                    (new.open_timestamp < old.open_timestamp, new.open),
+                    else_=old.open,
+                ),
+                "high": greatest(old.high, new.high),
+                "low": least(old.low, new.low),
+                "close": case(
+                    (new.close_timestamp >= old.close_timestamp, new.close),
+                    else_=old.close,
+                ),
+                "count": old.count + new.count,
+                "open_timestamp": least(old.open_timestamp, new.open_timestamp),
+                "close_timestamp": greatest(old.close_timestamp, new.close_timestamp),
+            },
+        )
+        for i in range(0, len(rollups), batch_size):
+            session.execute(upsert, rollups[i : i + batch_size])
+
+    def _merge_rollups(self, session, rollups, batch_size):
+        """Merge rollup rows into the stored ones without ON CONFLICT"""
+        table = PriceRollup.__table__
+        for i in range(0, len(rollups), batch_size):
+            batch = rollups[i : i + batch_size]
+            starts = [rollup["bucket_start"] for rollup in batch]
+            stored = {
+                (row["product_id"], row["resolution"], row["bucket_start"]): row
+                for row in session.execute(
+                    select(table).where(
+                        table.c.product_id.in_({r["product_id"] for r in batch}),
+                        table.c.bucket_start.between(min(starts), max(starts)),
+                    )
+                ).mappings()
+            }
+            updates, new = [], []
+            for rollup in batch:
+                key = (
+                    rollup["product_id"],
+                    rollup["resolution"],
+                    rollup["bucket_start"],
+                )
+                if key in stored:
+                    updates.append(merge(dict(stored[key]), rollup))
+                else:
+                    new.append(rollup)
+            if updates:
+                session.execute(update(PriceRollup), updates)
+            if new:
+                session.execute(insert(table), new)
+
+    def rebuild_rollups(self, batch_size=ADD_PRICES_BATCH_SIZE, product_ids=None):
+        """
+        Recompute the rollups of `product_ids`, or of every product, from the
+        raw price history. Of the scrapes folded into a row in change-only
+        mode, only the latest is still known.
+        """
+        query = select(
+            PriceHistory.product_id,
+            PriceHistory.price,
+            PriceHistory.timestamp,
+            PriceHistory.last_confirmed_at,
+        ).order_by(PriceHistory.product_id)
+        clear = delete(PriceRollup)
+        if product_ids is not None:
+            query = query.where(PriceHistory.product_id.in_(product_ids))
+            clear = clear.where(PriceRollup.product_id.in_(product_ids))
+
+        rebuilt = 0
+        with self.Session.begin() as session:
+            session.execute(clear)
+            pending, current_id = [], None
+            for row in session.execute(query).yield_per(batch_size):
+                # Rows arrive grouped by product, so buckets of earlier
+                # products are complete and can be written out
+                if row.product_id != current_id and len(pending) >= batch_size:
+                    rollups = aggregate(pending)
+                    session.execute(PriceRollup.__table__.insert(), rollups)
+                    rebuilt += len(rollups)
+                    pending = []
+                current_id = row.product_id
+                pending.append(row._asdict())
+                if row.last_confirmed_at is not None:
+                    pending.append(
+                        {**row._asdict(), "timestamp": row.last_confirmed_at}
+                    )
+
+            rollups = aggregate(pending)
+            if rollups:
+                session.execute(PriceRollup.__table__.insert(), rollups)
+            rebuilt += len(rollups)
+        return rebuilt
+
+    def get_price_rollups(self, resolution, urls=None, since=None):
+        """Get the rollups of many products at one resolution, newest first"""
         session = self.Session()
         try:
-            # First ensure the product exists
-            if not self.product_exists(product_data["url"]):
-                # Create the product if it doesn't exist
-                product = Product(url=product_data["url"])
-                session.add(product)
-                session.flush()  # Flush to ensure the product is created before adding price
-
-            # Convert timestamp string to datetime if it's a string
-            timestamp = product_data["timestamp"]
-            if isinstance(timestamp, str):
-                timestamp = datetime.strptime(timestamp, "%Y-%m-%d %H-%M")
-
-            price_history = PriceHistory(
-                id=f"{product_data['url']}_{timestamp.strftime('%Y%m%d%H%M%S')}",
-                product_url=product_data["url"],
-                name=product_data["name"],
-                price=product_data["price"],
-                currency=product_data["currency"],
-                main_image_url=product_data["main_image_url"],
-                timestamp=timestamp,
+            query = (
+                session.query(Product.url, PriceRollup)
+                .join(PriceRollup.product)
+                .filter(PriceRollup.resolution == resolution)
             )
-            session.add(price_history)
-            session.commit()
+            if urls is not None:
+                query = query.filter(Product.url.in_(list(urls)))
+            if since is not None:
+                # Include the partially covered bucket that `since` falls into
+                query = query.filter(
+                    PriceRollup.bucket_start >= bucket_start(since, resolution)
+                )
+            rollups = {}
+            for url, rollup in query.order_by(
+                PriceRollup.product_id, PriceRollup.bucket_start.desc()
+            ):
+                rollups.setdefault(url, []).append(rollup)
+            return rollups
         finally:
             session.close()
 
@@ -88,21 +586,111 @@ class Database:
 
     def get_price_history(self, url):
         """Get price history for a product"""
+        return self.get_price_histories([url]).get(url, [])
+
+    def get_price_histories(self, urls=None, since=None):
+        """
+        Get the price histories of many products as PricePoints, newest first,
+        in one query. A price that was confirmed by later scrapes also appears
+        at the time it was last confirmed, so the points form a step series.
+        """
+        # A Core select, since ORM row processing took longer than the query
+        query = (
+            select(
+                Product.url,
+                Product.name,
+                PriceHistory.price,
+                Product.currency,
+                Product.main_image_url,
+                PriceHistory.timestamp,
+                PriceHistory.last_confirmed_at,
+            )
+            .join(PriceHistory.product)
+            .order_by(PriceHistory.product_id, PriceHistory.timestamp.desc())
+        )
+        if urls is not None:
+            query = query.where(Product.url.in_(list(urls)))
+        if since is not None:
+            # Include the price that was still current at `since`. Not a
+            # coalesce of both times, so the indexes on them can be used
+            query = query.where(
+                or_(
+                    PriceHistory.timestamp >= since,
+                    PriceHistory.last_confirmed_at >= since,
+                )
+            )
+        with self.engine.connect() as connection:
+            rows = connection.execute(query).all()
+
+        histories = {}
+        points, current_url = None, None
+        for url, name, price, currency, image_url, timestamp, confirmed_at in rows:
+            # Rows arrive grouped by product
+            if url != current_url:
+                points, current_url = histories.setdefault(url, []), url
+            if confirmed_at is not None:
+                points.append(
+                    PricePoint(url, name, price, currency, image_url, confirmed_at)
+                )
+            if since is not None and timestamp < since:
+                timestamp = since
+            points.append(PricePoint(url, name, price, currency, image_url, timestamp))
+        return histories
+
+    def get_price_summaries(self):
+        """
+        Get a PriceSummary for every product with at least one price, computed
+        with window functions in a single query instead of loading histories
+        """
+        by_product = {"partition_by": PriceHistory.product_id}
+        newest_first = {**by_product, "order_by": PriceHistory.timestamp.desc()}
+        ranked = select(
+            PriceHistory.product_id,
+            func.first_value(PriceHistory.price)
+            .over(**by_product, order_by=PriceHistory.timestamp.asc())
+            .label("first_price"),
+            PriceHistory.price.label("latest_price"),
+            func.min(PriceHistory.price).over(**by_product).label("min_price"),
+            func.max(PriceHistory.price).over(**by_product).label("max_price"),
+            func.count().over(**by_product).label("price_count"),
+            func.min(PriceHistory.timestamp)
+            .over(**by_product)
+            .label("first_timestamp"),
+            func.coalesce(PriceHistory.last_confirmed_at, PriceHistory.timestamp).label(
+                "latest_timestamp"
+            ),
+            func.row_number().over(**newest_first).label("row_number"),
+        ).subquery()
+
+        product_columns = {
+            "url": Product.url,
+            "name": Product.name,
+            "currency": Product.currency,
+            "main_image_url": Product.main_image_url,
+        }
+        query = (
+            select(
+                *[
+                    product_columns.get(field, ranked.c.get(field))
+                    for field in PriceSummary._fields
+                ]
+            )
+            .join(Product, Product.id == ranked.c.product_id)
+            .where(ranked.c.row_number == 1)
+            .order_by(Product.url)
+        )
+
         session = self.Session()
         try:
-            return (
-                session.query(PriceHistory)
-                .filter(PriceHistory.product_url == url)
-                .order_by(PriceHistory.timestamp.desc())
-                .all()
-            )
+            return [PriceSummary(*row) for row in session.execute(query)]
         finally:
             session.close()
 
     def remove_all_products(self):
         session = self.Session()
         try:
-            # First delete all price histories
+            # First delete all rollups and price histories
+            session.query(PriceRollup).delete()
             session.query(PriceHistory).delete()
             # Then delete all products
             session.query(Product).delete()
@@ -0,0 +1,321 @@
+"""
+A local stand-in for the Firecrawl API, so scraping code can be exercised
+without network access or credits.
+
+It implements the endpoints the scrapers use (`/v1/scrape` and the
+`/v1/batch/scrape` job endpoints) and fills in the requested extract schema
+with deterministic values derived from each URL. Point the Firecrawl SDK at it
+with the `FIRECRAWL_API_URL` environment variable:
+
+    python fake_firecrawl.py --port 3002
+    FIRECRAWL_API_URL=http://127.0.0.1:3002 python check_prices.py
+
+Pages requested in the `rawHtml` format are rendered from the same values, so
+selector templates can be learned and applied against it.
+
+URLs containing "fail" are dropped from batch results and URLs containing
+"404" come back with a 404 status code, to mimic partial batch failures.
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Number of documents returned per batch status page before `next` is set
+PAGE_SIZE = 10
+
+# Fields of the product pages served as raw HTML
+PAGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "price": {"type": "number"},
+        "image_url": {"type": "string"},
+        "main_image_url": {"type": "string"},
+    },
+}
+
+
+def url_hash(url: str) -> int:
+    return int(hashlib.sha256(url.encode()).hexdigest(), 16)
+
+
+def fake_value(schema: dict, defs: dict, url: str, name: str = ""):
+    """Build a deterministic value for a JSON schema node"""
+    if "$ref" in schema:
+        return fake_value(defs[schema["$ref"].split("/")[-1]], defs, url, name)
+    if "anyOf" in schema:
+        options = [s for s in schema["anyOf"] if s.get("type") != "null"]
+        return fake_value(options[0], defs, url, name) if options else None
+
+    h = url_hash(f"{url}#{name}")
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            key: fake_value(prop, defs, url, key)
+            for key, prop in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        return [
+            fake_value(schema.get("items", {}), defs, f"{url}#{i}", name)
+            for i in range(3)
+        ]
+    if kind == "number":
+        return round(10 + (h % 100_000) / 100, 2)
+    if kind == "integer":
+        return h % 1000
+    if kind == "boolean":
+        return bool(h % 2)
+
+    lowered = name.lower()
+    if lowered == "url":
+        return url
+    if "url" in lowered:
+        return f"https://img.example.com/{h % 10**8}.jpg"
+    if lowered == "currency":
+        return "USD"
+    return f"{name.replace('_', ' ').title() or 'Value'} {h % 10**6}"
+
+
+def fake_page(url: str) -> str:
+    """A product page showing the values extract returns for the URL"""
+    values = {
+        key: html.escape(str(value), quote=True)
+        for key, value in fake_value(PAGE_SCHEMA, {}, url).items()
+    }
+    price = fake_value(PAGE_SCHEMA, {}, url)["price"]
+    return f"""<html>
+<head><title>{values["name"]} | Example Store</title></head>
+<body>
+  <div id="product">
+    <h1 class="product-title">{values["name"]}</h1>
+    <div class="price-box"><span class="price">${price:,.2f}</span></div>
+    <img class="gallery-image" src="{values["image_url"]}">
+    <img class="main-image" src="{values["main_image_url"]}">
+  </div>
+  <div class="related"><span class="price">$9.99</span></div>
+</body>
+</html>"""
+
+
+class FakeFirecrawl:
+    """
+    Fake Firecrawl server running in a background thread.
+
+    Args:
+        port (int): Port to listen on, 0 picks a free one
+        latency (float): Seconds every scrape and batch job takes
+        error_rate (float): Fraction of URLs (chosen by URL hash) that fail
+        extract_latency (float): Extra seconds of requests with LLM extraction
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        extract_latency: float = 0.0,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.extract_latency = extract_latency
+        self.jobs = {}
+        # Number of URLs in every batch job that was submitted
+        self.batch_sizes = []
+        self.scrape_count = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fails(self, url: str) -> bool:
+        if "fail" in url:
+            return True
+        return (url_hash(url) % 10_000) < self.error_rate * 10_000
+
+    def latency_of(self, body: dict) -> float:
+        if "extract" in (body.get("formats") or []):
+            return self.latency + self.extract_latency
+        return self.latency
+
+    def document(self, url: str, body: dict) -> dict:
+        metadata = {"sourceURL": url, "url": url, "statusCode": 200}
+        if "404" in url:
+            metadata.update(statusCode=404, error="Not Found")
+            return {"metadata": metadata}
+        document = {"metadata": metadata}
+        formats = body.get("formats") or []
+        if "extract" in formats or "extract" in body:
+            schema = (body.get("extract") or {}).get("schema") or {}
+            document["extract"] = fake_value(schema, schema.get("$defs", {}), url)
+        if "rawHtml" in formats:
+            document["rawHtml"] = fake_page(url)
+        return document
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _make_handler(fake):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload: dict):
+                body = json.dumps(payload, default=str).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+
+                if self.path == "/v1/scrape":
+                    url = body["url"]
+                    time.sleep(fake.latency_of(body))
+                    with fake._lock:
+                        fake.scrape_count += 1
+                    if fake.fails(url):
+                        self._send(500, {"success": False, "error": "Scrape failed"})
+                    else:
+                        self._send(
+                            200, {"success": True, "data": fake.document(url, body)}
+                        )
+                elif self.path == "/v1/batch/scrape":
+                    job_id = str(uuid.uuid4())
+                    with fake._lock:
+                        fake.batch_sizes.append(len(body["urls"]))
+                        fake.jobs[job_id] = {
+                            "body": body,
+                            "done_at": time.monotonic() + fake.latency_of(body),
+                        }
+                    self._send(
+                        200,
+                        {
+                            "success": True,
+                            "id": job_id,
+                            "url": f"{fake.url}/v1/batch/scrape/{job_id}",
+                        },
+                    )
+                else:
+                    self._send(404, {"success": False, "error": "Not found"})
+
+            def do_GET(self):
+                match = re.fullmatch(
+                    r"/v1/batch/scrape/([\w-]+)(?:\?skip=(\d+))?", self.path
+                )
+                job = match and fake.jobs.get(match.group(1))
+                if not job:
+                    self._send(404, {"success": False, "error": "Job not found"})
+                    return
+
+                urls = job["body"]["urls"]
+                status = {
+                    "success": True,
+                    "total": len(urls),
+                    "creditsUsed": len(urls),
+                    "expiresAt": None,
+                }
+                if time.monotonic() < job["done_at"]:
+                    self._send(200, {**status, "status": "scraping", "completed": 0})
+                    return
+
+                documents = [
+                    fake.document(url, job["body"])
+                    for url in urls
+                    if not fake.fails(url)
+                ]
+                skip = int(match.group(2) or 0)
+                status.update(
+                    status="completed",
+                    completed=len(documents),
+                    data=documents[skip : skip + PAGE_SIZE],
+                )
+                if skip + PAGE_SIZE < len(documents):
+                    status["next"] = (
+                        f"{fake.url}/v1/batch/scrape/{match.group(1)}"
+                        f"?skip={skip + PAGE_SIZE}"
+                    )
+                self._send(200, status)
+
+        return Handler
+
+
+def demo(n_urls: int, chunk_size: int, latency: float, error_rate: float):
+    """Run scraper.scrape_products against a fake server and report the result"""
+    import os
+
+    with FakeFirecrawl(latency=latency, error_rate=error_rate) as fake:
+        os.environ["FIRECRAWL_API_URL"] = fake.url
+        from scraper import scrape_products
+
+        urls = [f"https://www.example.com/product/{i}" for i in range(n_urls)]
+        urls += ["https://www.example.com/fail", "https://www.example.com/404"]
+
+        start = time.monotonic()
+        results = list(scrape_products(urls, chunk_size=chunk_size, poll_interval=0.1))
+        elapsed = time.monotonic() - start
+
+        failed = {url: str(error) for url, _, error in results if error}
+        print(f"Batch sizes: {fake.batch_sizes}")
+        print(f"{len(results)} results for {len(urls)} URLs in {elapsed:.2f}s")
+        print(f"{len(failed)} failed:")
+        for url, error in failed.items():
+            print(f"  {url}: {error}")
+
+        assert sorted(url for url, _, _ in results) == sorted(urls)
+        assert all(data["url"] == url for url, data, error in results if not error)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Firecrawl API server")
+    parser.add_argument("--port", type=int, default=3002)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--extract-latency",
+        type=float,
+        default=0.0,
+        help="extra seconds of requests with LLM extraction",
+    )
+    parser.add_argument(
+        "--demo",
+        type=int,
+        metavar="N",
+        help="batch scrape N fake product URLs against the server and exit",
+    )
+    parser.add_argument("--chunk-size", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.demo is not None:
+        demo(args.demo, args.chunk_size, args.latency, args.error_rate)
+    else:
+        fake = FakeFirecrawl(
+            args.port, args.latency, args.error_rate, args.extract_latency
+        )
+        print(f"Fake Firecrawl API listening on {fake.url}")
+        fake.server.serve_forever()
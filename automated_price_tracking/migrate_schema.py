@@ -0,0 +1,242 @@
+"""
+Copy price data from the original string-keyed tables (`products` and
+`price_histories`) into the compact integer-keyed layout used by Database
+(`tracked_products` and `product_prices`).
+
+The copy runs in small, separately committed batches, each followed by a
+rebuild of the rollups of the products it copied, and every statement is
+idempotent, so it can run while the old version of the tracker keeps writing
+and can be resumed or repeated at any time:
+
+    python migrate_schema.py                   # full copy
+    python migrate_schema.py --since "2024-12-01 00:00"   # catch up recent rows
+
+Once the new code is deployed and a final catch-up pass has run, the legacy
+tables can be removed with --drop-legacy, which refuses to drop them while
+any legacy product or price is missing from the new tables.
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    MetaData,
+    String,
+    Table,
+    and_,
+    func,
+    inspect,
+    select,
+)
+
+from database import Database, PriceHistory, Product
+
+MIGRATION_BATCH_SIZE = 5000
+
+legacy_metadata = MetaData()
+
+legacy_products = Table(
+    "products",
+    legacy_metadata,
+    Column("url", String, primary_key=True),
+)
+
+legacy_price_histories = Table(
+    "price_histories",
+    legacy_metadata,
+    Column("id", String, primary_key=True),
+    Column("product_url", String, ForeignKey("products.url")),
+    Column("name", String, nullable=False),
+    Column("price", Float, nullable=False),
+    Column("currency", String, nullable=False),
+    Column("main_image_url", String),
+    Column("timestamp", DateTime, nullable=False),
+)
+
+
+def copy_products(db: Database) -> int:
+    """Copy every legacy product with the details of its latest price"""
+    latest = (
+        select(
+            legacy_price_histories.c.product_url,
+            legacy_price_histories.c.name,
+            legacy_price_histories.c.currency,
+            legacy_price_histories.c.main_image_url,
+            legacy_price_histories.c.timestamp,
+            func.row_number()
+            .over(
+                partition_by=legacy_price_histories.c.product_url,
+                order_by=legacy_price_histories.c.timestamp.desc(),
+            )
+            .label("row_number"),
+        )
+    ).subquery()
+    details = select(
+        legacy_products.c.url,
+        latest.c.name,
+        latest.c.currency,
+        latest.c.main_image_url,
+        latest.c.timestamp,
+    ).outerjoin(
+        latest,
+        and_(latest.c.product_url == legacy_products.c.url, latest.c.row_number == 1),
+    )
+
+    insert = (
+        db._insert(Product.__table__)
+        .from_select(
+            ["url", "name", "currency", "main_image_url", "updated_at"], details
+        )
+        .on_conflict_do_nothing(index_elements=["url"])
+    )
+    with db.engine.begin() as connection:
+        return connection.execute(insert).rowcount
+
+
+def copy_prices(db: Database, batch_size=MIGRATION_BATCH_SIZE, since=None) -> int:
+    """
+    Copy legacy price rows in batches walked along the legacy primary key.
+    Each batch is a single INSERT ... SELECT, so rows never leave the server,
+    and the rollups of its products are rebuilt in a short transaction after.
+    """
+    legacy = legacy_price_histories.c
+    new_rows = (
+        select(Product.id, legacy.price, legacy.timestamp)
+        .select_from(legacy_price_histories)
+        .join(Product.__table__, Product.url == legacy.product_url)
+    )
+    if since is not None:
+        new_rows = new_rows.where(legacy.timestamp >= since)
+
+    copied, rebuilt, last_id = 0, 0, None
+    while True:
+        # Find the upper bound of the next batch using the primary key index
+        bounds = select(legacy.id).order_by(legacy.id).offset(batch_size - 1).limit(1)
+        if last_id is not None:
+            bounds = bounds.where(legacy.id > last_id)
+        with db.engine.connect() as connection:
+            upper_id = connection.execute(bounds).scalar()
+
+        batch = new_rows
+        if last_id is not None:
+            batch = batch.where(legacy.id > last_id)
+        if upper_id is not None:
+            batch = batch.where(legacy.id <= upper_id)
+
+        insert = (
+            db._insert(PriceHistory.__table__)
+            .from_select(["product_id", "price", "timestamp"], batch)
+            .on_conflict_do_nothing(index_elements=["product_id", "timestamp"])
+        )
+        with db.engine.begin() as connection:
+            copied += connection.execute(insert).rowcount
+            product_ids = (
+                connection.execute(batch.with_only_columns(Product.id).distinct())
+                .scalars()
+                .all()
+            )
+        if product_ids:
+            rebuilt += db.rebuild_rollups(product_ids=product_ids)
+        print(
+            f"Copied {copied} price rows and rebuilt {rebuilt} rollups "
+            f"(up to id {upper_id or 'end'})"
+        )
+
+        if upper_id is None:
+            return copied
+        last_id = upper_id
+
+
+def migrate(db: Database, batch_size=MIGRATION_BATCH_SIZE, since=None):
+    if not inspect(db.engine).has_table(legacy_price_histories.name):
+        print("No legacy price_histories table found, nothing to migrate")
+        return
+
+    start = time.perf_counter()
+    print(f"Copied {copy_products(db)} products")
+    copy_prices(db, batch_size, since)
+    print(f"Migration finished in {time.perf_counter() - start:.1f}s")
+
+
+def count_migrated(db: Database) -> dict:
+    """Legacy rows and their copies in the new tables, by legacy table"""
+    legacy = legacy_price_histories.c
+    copied_prices = (
+        select(func.count())
+        .select_from(legacy_price_histories)
+        .join(Product.__table__, Product.url == legacy.product_url)
+        .join(
+            PriceHistory.__table__,
+            and_(
+                PriceHistory.product_id == Product.id,
+                PriceHistory.timestamp == legacy.timestamp,
+            ),
+        )
+    )
+    copied_products = (
+        select(func.count())
+        .select_from(legacy_products)
+        .join(Product.__table__, Product.url == legacy_products.c.url)
+    )
+    with db.engine.connect() as connection:
+        return {
+            legacy_products.name: (
+                connection.scalar(select(func.count()).select_from(legacy_products)),
+                connection.scalar(copied_products),
+            ),
+            legacy_price_histories.name: (
+                connection.scalar(
+                    select(func.count()).select_from(legacy_price_histories)
+                ),
+                connection.scalar(copied_prices),
+            ),
+        }
+
+
+def drop_legacy_tables(db: Database) -> bool:
+    """Drop the legacy tables, unless some of their rows were not copied"""
+    counts = count_migrated(db)
+    for table, (legacy_count, copied_count) in counts.items():
+        print(f"{table}: {legacy_count} legacy rows, {copied_count} copied")
+    if any(legacy_count != copied for legacy_count, copied in counts.values()):
+        print("Not dropping the legacy tables, run the migration again first")
+        return False
+    legacy_metadata.drop_all(db.engine)
+    print("Dropped legacy products and price_histories tables")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Migrate price data to the compact schema"
+    )
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument(
+        "--since",
+        type=lambda value: datetime.strptime(value, "%Y-%m-%d %H:%M"),
+        help='only copy prices recorded at or after "YYYY-MM-DD HH:MM"',
+    )
+    parser.add_argument(
+        "--drop-legacy",
+        action="store_true",
+        help="drop the legacy tables instead of migrating",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = Database(os.getenv("POSTGRES_URL"))
+    # The new tables are copied into, so make sure they exist
+    db.setup()
+
+    if args.drop_legacy:
+        if not drop_legacy_tables(db):
+            parser.exit(1)
+    else:
+        migrate(db, args.batch_size, args.since)
@@ -0,0 +1,129 @@
+"""
+Local stand-in for a Discord webhook, for trying out AlertDispatcher without
+posting to a real channel.
+
+Each webhook allows `--limit` requests per `--window` seconds, like Discord's
+per-route buckets, and reports the bucket in X-RateLimit-* headers. Requests
+over the limit get a 429 with `retry_after`. Messages with more than 10 embeds
+are rejected.
+
+    python mock_discord.py --demo 500      # time 500 alerts through the mock
+    python mock_discord.py --port 8765     # serve until interrupted, then
+    DISCORD_WEBHOOK_URL=http://127.0.0.1:8765/webhook python check_prices.py
+"""
+
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+
+from notifications import MAX_EMBEDS_PER_MESSAGE, AlertDispatcher
+
+
+class MockDiscord:
+    def __init__(self, limit: int = 5, window: float = 2.0):
+        self.limit = limit
+        self.window = window
+        self.messages = 0
+        self.embeds = 0
+        self.rate_limited = 0
+        self._window_start = 0.0
+        self._used = 0
+        self.app = web.Application()
+        self.app.router.add_post("/webhook", self.webhook)
+
+    async def webhook(self, request):
+        now = time.monotonic()
+        if now - self._window_start >= self.window:
+            self._window_start, self._used = now, 0
+        reset_after = self.window - (now - self._window_start)
+
+        if self._used >= self.limit:
+            self.rate_limited += 1
+            return web.json_response(
+                {
+                    "message": "You are being rate limited.",
+                    "retry_after": round(reset_after, 3),
+                    "global": False,
+                },
+                status=429,
+                headers={"Retry-After": str(round(reset_after, 3))},
+            )
+
+        self._used += 1
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.limit - self._used),
+            "X-RateLimit-Reset-After": str(round(reset_after, 3)),
+        }
+        embeds = (await request.json()).get("embeds", [])
+        if len(embeds) > MAX_EMBEDS_PER_MESSAGE:
+            return web.json_response(
+                {"message": "Too many embeds"}, status=400, headers=headers
+            )
+
+        self.messages += 1
+        self.embeds += len(embeds)
+        return web.Response(status=204, headers=headers)
+
+    async def start(self, port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/webhook"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+async def demo(n_alerts: int, limit: int, window: float):
+    mock = MockDiscord(limit, window)
+    url = await mock.start()
+
+    start = time.perf_counter()
+    async with AlertDispatcher(url) as alerts:
+        for i in range(n_alerts):
+            alerts.add_price_alert(
+                f"Product {i}", 100, 90, f"https://www.example.com/product/{i}"
+            )
+    elapsed = time.perf_counter() - start
+    await mock.stop()
+
+    print(alerts)
+    print(
+        f"Mock received {mock.embeds}/{n_alerts} alerts in {mock.messages} messages, "
+        f"answered {mock.rate_limited} requests with 429"
+    )
+    print(f"Finished in {elapsed:.1f}s ({n_alerts / elapsed:.1f} alerts/sec)")
+
+
+async def serve(port: int, limit: int, window: float):
+    mock = MockDiscord(limit, window)
+    print(f"Mock webhook listening on {await mock.start(port)}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await mock.stop()
+        print(f"Received {mock.embeds} alerts in {mock.messages} messages")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Discord webhook server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--limit", type=int, default=5, help="requests per window")
+    parser.add_argument("--window", type=float, default=2.0, help="seconds")
+    parser.add_argument(
+        "--demo", type=int, metavar="N", help="send N alerts and report throughput"
+    )
+    args = parser.parse_args()
+
+    if args.demo:
+        asyncio.run(demo(args.demo, args.limit, args.window))
+    else:
+        try:
+            asyncio.run(serve(args.port, args.limit, args.window))
+        except KeyboardInterrupt:
+            pass
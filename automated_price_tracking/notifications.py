@@ -1,35 +1,175 @@
 from dotenv import load_dotenv
 import os
+import time
 import aiohttp
 import asyncio
 
 load_dotenv()
 
+# Discord accepts at most 10 embeds per webhook message
+MAX_EMBEDS_PER_MESSAGE = 10
 
-async def send_price_alert(
-    product_name: str, old_price: float, new_price: float, url: str
-):
-    """Send a price drop alert to Discord"""
+
+def price_alert_embed(product_name: str, old_price: float, new_price: float, url: str):
+    """Build the Discord embed announcing a price drop"""
     drop_percentage = ((old_price - new_price) / old_price) * 100
 
-    message = {
-        "embeds": [
-            {
-                "title": "Price Drop Alert! 🎉",
-                "description": f"**{product_name}**\nPrice dropped by {drop_percentage:.1f}%!\n"
-                f"Old price: ${old_price:.2f}\n"
-                f"New price: ${new_price:.2f}\n"
-                f"[View Product]({url})",
-                "color": 3066993,
-            }
-        ]
+    return {
+        "title": "Price Drop Alert! 🎉",
+        "description": f"**{product_name}**\nPrice dropped by {drop_percentage:.1f}%!\n"
+        f"Old price: ${old_price:.2f}\n"
+        f"New price: ${new_price:.2f}\n"
+        f"[View Product]({url})",
+        "color": 3066993,
     }
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            await session.post(os.getenv("DISCORD_WEBHOOK_URL"), json=message)
-    except Exception as e:
-        print(f"Error sending Discord notification: {e}")
+
+class AlertDispatcher:
+    """
+    Queues Discord embeds and delivers them over one pooled HTTP session.
+
+    Embeds are packed up to 10 per webhook message and messages are sent one
+    at a time in the background, waiting out 429 responses (`retry_after` /
+    `Retry-After`) and empty rate limit buckets (`X-RateLimit-Remaining` and
+    `X-RateLimit-Reset-After`). Use it as an async context manager; leaving the
+    block flushes everything that is still queued.
+
+    Args:
+        webhook_url (str): Discord webhook URL, DISCORD_WEBHOOK_URL if None
+        max_retries (int): Failed attempts per message before it is dropped.
+            429 responses are waited out and do not count.
+        max_rate_limit_wait (float): Seconds a message waits out rate limits
+            at most before it is dropped
+    """
+
+    def __init__(
+        self,
+        webhook_url=None,
+        max_retries: int = 5,
+        max_rate_limit_wait: float = 600.0,
+    ):
+        self.webhook_url = webhook_url or os.getenv("DISCORD_WEBHOOK_URL")
+        self.max_retries = max_retries
+        self.max_rate_limit_wait = max_rate_limit_wait
+        self.messages_sent = 0
+        self.embeds_sent = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self._embeds = []
+        self._queue = asyncio.Queue()
+        self._session = None
+        self._worker = None
+        # Monotonic time before which the current rate limit bucket is empty
+        self._bucket_reset_at = 0.0
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=1),
+            timeout=aiohttp.ClientTimeout(total=30),
+        )
+        self._worker = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc):
+        try:
+            await self.flush()
+        finally:
+            self._worker.cancel()
+            await self._session.close()
+
+    def add(self, embed: dict):
+        """Queue an embed, sending a message once 10 embeds are waiting"""
+        self._embeds.append(embed)
+        if len(self._embeds) == MAX_EMBEDS_PER_MESSAGE:
+            self._queue.put_nowait({"embeds": self._embeds})
+            self._embeds = []
+
+    def add_price_alert(
+        self, product_name: str, old_price: float, new_price: float, url: str
+    ):
+        self.add(price_alert_embed(product_name, old_price, new_price, url))
+
+    async def flush(self):
+        """Send every queued embed and wait until delivery has finished"""
+        if self._embeds:
+            self._queue.put_nowait({"embeds": self._embeds})
+            self._embeds = []
+        await self._queue.join()
+
+    async def _run(self):
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._post(message)
+            except Exception as e:
+                self.failed += len(message["embeds"])
+                print(f"Error sending Discord notification: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _post(self, message: dict):
+        if not self.webhook_url:
+            raise ValueError("DISCORD_WEBHOOK_URL is not set")
+
+        deadline = time.monotonic() + self.max_rate_limit_wait
+        attempt = 0
+        while attempt < self.max_retries:
+            wait = self._bucket_reset_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            async with self._session.post(self.webhook_url, json=message) as response:
+                if response.headers.get("X-RateLimit-Remaining") == "0":
+                    reset_after = float(
+                        response.headers.get("X-RateLimit-Reset-After", 0)
+                    )
+                    self._bucket_reset_at = time.monotonic() + reset_after
+
+                if response.status == 429:
+                    self.rate_limited += 1
+                    try:
+                        body = await response.json(content_type=None) or {}
+                    except ValueError:
+                        body = {}
+                    retry_after = float(
+                        body.get("retry_after")
+                        or response.headers.get("Retry-After", 1)
+                    )
+                    self._bucket_reset_at = time.monotonic() + retry_after
+                    if self._bucket_reset_at > deadline:
+                        raise Exception(
+                            f"Rate limited for over {self.max_rate_limit_wait:.0f}s"
+                        )
+                    # Waiting out a rate limit is not a failed attempt
+                    continue
+                if response.status >= 500:
+                    await asyncio.sleep(2**attempt)
+                    attempt += 1
+                    continue
+                if response.status >= 400:
+                    raise Exception(
+                        f"Discord returned {response.status}: {await response.text()}"
+                    )
+
+                self.messages_sent += 1
+                self.embeds_sent += len(message["embeds"])
+                return
+
+        raise Exception(f"Giving up after {self.max_retries} attempts")
+
+    def __str__(self):
+        return (
+            f"Sent {self.embeds_sent} alerts in {self.messages_sent} messages "
+            f"({self.rate_limited} rate limited, {self.failed} failed)"
+        )
+
+
+async def send_price_alert(
+    product_name: str, old_price: float, new_price: float, url: str
+):
+    """Send a price drop alert to Discord"""
+    async with AlertDispatcher() as alerts:
+        alerts.add_price_alert(product_name, old_price, new_price, url)
 
 
 if __name__ == "__main__":
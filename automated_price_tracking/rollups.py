@@ -0,0 +1,101 @@
+"""
+Hourly and daily open/high/low/close aggregates of product prices.
+
+Database.add_prices keeps the `product_price_rollups` table up to date as
+prices are written. Run this module to rebuild every rollup from the raw
+price history:
+
+    python rollups.py
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+RESOLUTIONS = ("hour", "day")
+
+# Longest time span (in days) that is still charted at each resolution. Spans
+# longer than the last entry are charted with daily rollups.
+RAW_MAX_DAYS = 2
+HOURLY_MAX_DAYS = 31
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    """Truncate a timestamp to the start of its hour or day"""
+    if resolution == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if resolution == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup resolution: {resolution}")
+
+
+def aggregate(rows, resolutions=RESOLUTIONS) -> list[dict]:
+    """
+    Aggregate price rows (dicts with product_id, price and timestamp) into
+    one rollup row per product, resolution and bucket
+    """
+    buckets = {}
+    for row in rows:
+        price, timestamp = row["price"], row["timestamp"]
+        for resolution in resolutions:
+            key = (row["product_id"], resolution, bucket_start(timestamp, resolution))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {
+                    "product_id": key[0],
+                    "resolution": key[1],
+                    "bucket_start": key[2],
+                    "open": price,
+                    "high": price,
+                    "low": price,
+                    "close": price,
+                    "count": 1,
+                    "open_timestamp": timestamp,
+                    "close_timestamp": timestamp,
+                }
+                continue
+
+            bucket["high"] = max(bucket["high"], price)
+            bucket["low"] = min(bucket["low"], price)
+            bucket["count"] += 1
+            if timestamp < bucket["open_timestamp"]:
+                bucket["open"], bucket["open_timestamp"] = price, timestamp
+            if timestamp >= bucket["close_timestamp"]:
+                bucket["close"], bucket["close_timestamp"] = price, timestamp
+    return list(buckets.values())
+
+
+def merge(old: dict, new: dict) -> dict:
+    """Combine a stored rollup row with a new one of the same bucket"""
+    merged = dict(old)
+    merged["high"] = max(old["high"], new["high"])
+    merged["low"] = min(old["low"], new["low"])
+    merged["count"] = old["count"] + new["count"]
+    if new["open_timestamp"] < old["open_timestamp"]:
+        merged["open"], merged["open_timestamp"] = new["open"], new["open_timestamp"]
+    if new["close_timestamp"] >= old["close_timestamp"]:
+        merged["close"] = new["close"]
+        merged["close_timestamp"] = new["close_timestamp"]
+    return merged
+
+
+def choose_resolution(span: Optional[timedelta]) -> Optional[str]:
+    """
+    Pick the coarsest useful resolution for charting a time span, so a chart
+    never needs more than a few hundred points. None means raw prices.
+    """
+    if span is None or span <= timedelta(days=RAW_MAX_DAYS):
+        return None
+    if span <= timedelta(days=HOURLY_MAX_DAYS):
+        return "hour"
+    return "day"
+
+
+if __name__ == "__main__":
+    import os
+    from dotenv import load_dotenv
+    from database import Database
+
+    load_dotenv()
+
+    db = Database(os.getenv("POSTGRES_URL"))
+    print(f"Rebuilt {db.rebuild_rollups()} price rollups")
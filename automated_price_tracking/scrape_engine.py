@@ -0,0 +1,203 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import zip_longest
+from typing import Any, AsyncIterator, Callable, Iterable, Optional
+from urllib.parse import urlparse
+
+# Minimum number of seconds between two requests to the same domain.
+# Amazon throttles much harder than BestBuy, so it gets a wider spacing.
+DOMAIN_INTERVALS = {
+    "amazon.com": 2.0,
+    "bestbuy.com": 0.5,
+}
+DEFAULT_DOMAIN_INTERVAL = 0.25
+
+
+def get_domain(url: str) -> str:
+    """Return the registrable part of a URL's host, e.g. amazon.com"""
+    netloc = urlparse(url).netloc.lower().split(":")[0]
+    if netloc.startswith("www."):
+        netloc = netloc[4:]
+    return netloc
+
+
+def interleave_by_domain(urls: Iterable[str]) -> list[str]:
+    """Order URLs round-robin by domain so workers don't queue up on one site"""
+    groups = defaultdict(list)
+    for url in urls:
+        groups[get_domain(url)].append(url)
+    return [
+        url
+        for batch in zip_longest(*groups.values())
+        for url in batch
+        if url is not None
+    ]
+
+
+class DomainRateLimiter:
+    """Spaces out requests per domain by reserving the next free time slot"""
+
+    def __init__(self, intervals: Optional[dict] = None, default_interval=None):
+        self.intervals = DOMAIN_INTERVALS if intervals is None else intervals
+        self.default_interval = (
+            DEFAULT_DOMAIN_INTERVAL if default_interval is None else default_interval
+        )
+        self._next_slot = {}
+
+    def interval_for(self, domain: str) -> float:
+        for suffix, interval in self.intervals.items():
+            if domain == suffix or domain.endswith("." + suffix):
+                return interval
+        return self.default_interval
+
+    async def wait(self, url: str):
+        domain = get_domain(url)
+        now = time.monotonic()
+        # No await between reading and updating the slot, so this is safe
+        # across tasks running on the same event loop
+        slot = max(now, self._next_slot.get(domain, now))
+        self._next_slot[domain] = slot + self.interval_for(domain)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+@dataclass
+class ScrapeResult:
+    url: str
+    data: Any = None
+    error: Optional[Exception] = None
+    attempts: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class RunSummary:
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"Scraped {self.total} pages in {self.elapsed:.1f}s "
+            f"({self.pages_per_second:.2f} pages/sec): "
+            f"{self.succeeded} succeeded, {self.failed} failed, "
+            f"{self.retries} retries"
+        )
+
+
+class ScrapeEngine:
+    """
+    Runs a blocking scrape function over many URLs with bounded concurrency,
+    per-domain rate limits and optional retries with jittered exponential
+    backoff.
+
+    Retries are owned by the scrape function: the shared Firecrawl client
+    retries rate limited (429), unavailable (502-504) and failed connections
+    itself, FIRECRAWL_MAX_RETRIES times with backoff. The engine's per-URL
+    retries come on top of those and are off by default; only turn them on
+    for scrape functions that do not retry.
+
+    Args:
+        scrape_fn (Callable): Blocking function taking a URL and returning its data
+        concurrency (int): Maximum number of scrapes in flight at once
+        max_retries (int): Retries per URL after the first failed attempt, on
+            top of the scrape function's own
+        base_delay (float): Backoff base in seconds, doubled on every retry
+        max_delay (float): Upper bound for a single backoff sleep in seconds
+        rate_limiter (DomainRateLimiter): Per-domain limiter, a default one if None
+    """
+
+    def __init__(
+        self,
+        scrape_fn: Callable[[str], Any],
+        concurrency: int = 8,
+        max_retries: int = 0,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        rate_limiter: Optional[DomainRateLimiter] = None,
+    ):
+        self.scrape_fn = scrape_fn
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limiter = rate_limiter or DomainRateLimiter()
+        self.summary = RunSummary()
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def _scrape_one(self, url: str, executor) -> ScrapeResult:
+        loop = asyncio.get_running_loop()
+        result = ScrapeResult(url=url)
+        start = time.monotonic()
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.summary.retries += 1
+                await asyncio.sleep(self.backoff(attempt - 1))
+
+            await self.rate_limiter.wait(url)
+            result.attempts = attempt + 1
+            try:
+                result.data = await loop.run_in_executor(executor, self.scrape_fn, url)
+                result.error = None
+                break
+            except Exception as e:
+                result.error = e
+
+        result.elapsed = time.monotonic() - start
+        return result
+
+    async def run(self, urls: Iterable[str]) -> AsyncIterator[ScrapeResult]:
+        """Scrape all URLs, yielding each result as soon as it is ready"""
+        queue = asyncio.Queue()
+        for url in interleave_by_domain(urls):
+            queue.put_nowait(url)
+
+        self.summary = RunSummary(total=queue.qsize())
+        if not self.summary.total:
+            return
+
+        results = asyncio.Queue()
+        # The scrape function blocks, so each worker gets its own thread
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        async def worker():
+            while not queue.empty():
+                url = queue.get_nowait()
+                await results.put(await self._scrape_one(url, executor))
+
+        start = time.monotonic()
+        workers = [
+            asyncio.create_task(worker())
+            for _ in range(min(self.concurrency, self.summary.total))
+        ]
+        try:
+            for _ in range(self.summary.total):
+                result = await results.get()
+                if result.ok:
+                    self.summary.succeeded += 1
+                else:
+                    self.summary.failed += 1
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.summary.elapsed = time.monotonic() - start
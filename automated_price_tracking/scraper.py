@@ -1,10 +1,31 @@
-from firecrawl import FirecrawlApp
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
-app = FirecrawlApp()
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared"))
+from canonical_urls import group_by_canonical
+from fetch_gate import FetchGate
+from firecrawl_client import get_client
+from selector_templates import SelectorTemplates
+
+# Number of URLs submitted in a single Firecrawl batch job
+BATCH_CHUNK_SIZE = 100
+# Number of batch jobs allowed to run on Firecrawl at the same time
+MAX_ACTIVE_JOBS = 4
+# Seconds after which an unfinished batch job is reported as failed
+BATCH_JOB_TIMEOUT = 900
+# Seconds between status checks of running batch jobs
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "2"))
+# A page with unchanged content is only reused if its last extracted price is
+# still in it, so a bot challenge page is never mistaken for the product
+GATE_KEY_FIELDS = ("price",)
 
 
 class Product(BaseModel):
@@ -17,21 +38,269 @@ class Product(BaseModel):
     main_image_url: str = Field(description="The URL of the main image of the product")
 
 
-def scrape_product(url: str):
-    extracted_data = app.scrape_url(
-        url,
-        params={
-            "formats": ["extract"],
-            "extract": {"schema": Product.model_json_schema()},
-        },
+# Pages of domains with a learned selector template are only fetched as HTML
+HTML_PARAMS = {"formats": ["rawHtml"]}
+
+
+def get_selector_templates(engine) -> SelectorTemplates:
+    # The URL is the scraped one and the currency is often only shown as "$"
+    return SelectorTemplates(
+        engine, Product, url_field="url", fixed_fields=("currency",)
     )
 
-    # Add the scraping date to the extracted data
-    extracted_data["extract"]["timestamp"] = datetime.utcnow()
+
+def _learns(templates: Optional[SelectorTemplates]) -> bool:
+    return templates is not None and templates.enabled
+
+
+def get_extract_params(with_html: bool = False):
+    return {
+        "formats": ["extract", "rawHtml"] if with_html else ["extract"],
+        "extract": {"schema": Product.model_json_schema()},
+    }
+
+
+def finalize_product(extracted: dict, url: str) -> dict:
+    """Key the extracted data by the scraped URL and add the scraping date"""
+    extracted["url"] = url
+    extracted["timestamp"] = datetime.utcnow()
+    return extracted
+
+
+def _extract_product(url, templates, expected_price) -> dict:
+    learn = _learns(templates)
+    if learn and templates.has(url):
+        page = get_client().scrape_url(url, params=HTML_PARAMS)
+        data = templates.extract(
+            url, page.get("rawHtml"), expected={"price": expected_price}
+        )
+        if data is not None:
+            return data
+
+    extracted_data = get_client().scrape_url(url, params=get_extract_params(learn))
+    if learn:
+        templates.learn(url, extracted_data.get("rawHtml"), extracted_data["extract"])
 
     return extracted_data["extract"]
 
 
+def scrape_product(
+    url: str,
+    templates: Optional[SelectorTemplates] = None,
+    expected_price: Optional[float] = None,
+    gate: Optional[FetchGate] = None,
+):
+    """
+    Scrape a product, with its domain's selector template if `templates` has
+    one and with an LLM extract otherwise or when the template fails.
+
+    With `gate`, the page is fetched directly first and its last extraction
+    is reused if it has not changed since.
+    """
+    check = gate.check(url, GATE_KEY_FIELDS) if gate is not None else None
+    if check is not None and check.unchanged:
+        gate.record(check, check.result)
+        return finalize_product(dict(check.result), url)
+
+    start = time.perf_counter()
+    data = _extract_product(url, templates, expected_price)
+    if check is not None:
+        gate.record(check, dict(data), time.perf_counter() - start)
+    return finalize_product(data, url)
+
+
+def _normalize_url(url: str) -> str:
+    return (url or "").rstrip("/")
+
+
+def _match_documents(urls: list[str], documents: list[dict]):
+    """
+    Match batch documents to the submitted URLs, yielding `(url, document,
+    error)` with an error for missing and failed pages
+    """
+    documents_by_url = {}
+    for document in documents:
+        metadata = document.get("metadata") or {}
+        source_url = metadata.get("sourceURL") or metadata.get("url")
+        documents_by_url[_normalize_url(source_url)] = document
+
+    for url in urls:
+        document = documents_by_url.get(_normalize_url(url))
+        if document is None:
+            yield url, None, Exception("Batch job returned no result for URL")
+            continue
+
+        metadata = document.get("metadata") or {}
+        status_code = metadata.get("statusCode") or 200
+        if metadata.get("error") or status_code >= 400:
+            error = metadata.get("error") or f"Status code {status_code}"
+            yield url, None, Exception(f"Failed to scrape URL. Error: {error}")
+        else:
+            yield url, document, None
+
+
+def _map_batch_results(urls: list[str], documents: list[dict], templates=None):
+    """Yield the extracted products of a batch job, learning their templates"""
+    for url, document, error in _match_documents(urls, documents):
+        if error is not None:
+            yield url, None, error
+        elif not document.get("extract"):
+            yield url, None, Exception("Batch job returned no extracted data")
+        else:
+            if _learns(templates):
+                templates.learn(url, document.get("rawHtml"), document["extract"])
+            yield url, finalize_product(document["extract"], url), None
+
+
+def _extract_batch_results(urls, documents, templates, expected_prices, fallback):
+    """
+    Yield the products of an HTML-only batch job extracted with their
+    templates, adding the URLs a template fails on to `fallback`
+    """
+    for url, document, error in _match_documents(urls, documents):
+        if error is not None:
+            yield url, None, error
+            continue
+        data = templates.extract(
+            url, document.get("rawHtml"), expected={"price": expected_prices.get(url)}
+        )
+        if data is None:
+            fallback.append(url)
+        else:
+            yield url, finalize_product(data, url), None
+
+
+def scrape_products(
+    urls,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    max_active_jobs: int = MAX_ACTIVE_JOBS,
+    poll_interval: float = BATCH_POLL_INTERVAL,
+    job_timeout: float = BATCH_JOB_TIMEOUT,
+    templates: Optional[SelectorTemplates] = None,
+    expected_prices: Optional[dict] = None,
+    gate: Optional[FetchGate] = None,
+):
+    """
+    Scrape many products with Firecrawl batch jobs.
+
+    URLs are submitted in chunks of `chunk_size`, with at most `max_active_jobs`
+    jobs running at once. Results are yielded as `(url, data, error)` tuples as
+    soon as the job holding them finishes; exactly one of `data` and `error`
+    is set for every unique URL. URLs of the same page, i.e. with the same
+    canonical URL, are scraped once and share the result.
+
+    With `templates`, URLs of domains with a learned template are fetched as
+    HTML only and extracted locally. URLs whose template fails, or whose price
+    is far from `expected_prices`, are resubmitted with LLM extraction.
+
+    With `gate`, all pages are fetched directly first and the last
+    extraction of every page that has not changed since is reused without
+    submitting it.
+    """
+    groups = group_by_canonical(urls)
+    expected_prices = expected_prices or {}
+    checks = (
+        gate.check_many(list(groups), key_fields=GATE_KEY_FIELDS)
+        if gate is not None
+        else {}
+    )
+    for canonical_url, check in checks.items():
+        if check.unchanged:
+            gate.record(check, check.result)
+            data = finalize_product(dict(check.result), canonical_url)
+            for url in groups[canonical_url]:
+                yield url, {**data, "url": url}, None
+
+    results = _scrape_batches(
+        [url for url in groups if url not in checks or not checks[url].unchanged],
+        chunk_size,
+        max_active_jobs,
+        poll_interval,
+        job_timeout,
+        templates,
+        {canonical: expected_prices.get(urls[0]) for canonical, urls in groups.items()},
+    )
+    for canonical_url, data, error in results:
+        if data is not None and canonical_url in checks:
+            extracted = {k: v for k, v in data.items() if k != "timestamp"}
+            gate.record(checks[canonical_url], extracted)
+        for url in groups[canonical_url]:
+            yield url, None if data is None else {**data, "url": url}, error
+
+
+def _scrape_batches(
+    urls,
+    chunk_size,
+    max_active_jobs,
+    poll_interval,
+    job_timeout,
+    templates,
+    expected_prices,
+):
+    """Scrape distinct URLs with batch jobs, see `scrape_products`"""
+    learn = _learns(templates)
+    templated = [url for url in urls if learn and templates.has(url)]
+    templated_set = set(templated)
+    extracted = [url for url in urls if url not in templated_set]
+
+    def make_chunks(urls, params):
+        return [
+            (urls[i : i + chunk_size], params) for i in range(0, len(urls), chunk_size)
+        ]
+
+    chunks = make_chunks(templated, HTML_PARAMS)
+    chunks += make_chunks(extracted, get_extract_params(learn))
+    active_jobs = {}
+
+    while chunks or active_jobs:
+        # Keep the job pipeline full
+        while chunks and len(active_jobs) < max_active_jobs:
+            chunk, params = chunks.pop(0)
+            try:
+                job = get_client().async_batch_scrape_urls(chunk, params=params)
+                if not job or not job.get("id"):
+                    raise Exception(f"Failed to start batch job: {job}")
+            except Exception as e:
+                for url in chunk:
+                    yield url, None, e
+                continue
+            active_jobs[job["id"]] = (chunk, params, time.monotonic())
+
+        for job_id, (chunk, params, started) in list(active_jobs.items()):
+            try:
+                status = get_client().check_batch_scrape_status(job_id)
+            except Exception as e:
+                del active_jobs[job_id]
+                for url in chunk:
+                    yield url, None, e
+                continue
+
+            if status["status"] == "completed":
+                del active_jobs[job_id]
+                documents = status.get("data") or []
+                if params is HTML_PARAMS:
+                    fallback = []
+                    yield from _extract_batch_results(
+                        chunk, documents, templates, expected_prices, fallback
+                    )
+                    chunks += make_chunks(fallback, get_extract_params(learn))
+                else:
+                    yield from _map_batch_results(chunk, documents, templates)
+            elif status["status"] in ("failed", "cancelled"):
+                del active_jobs[job_id]
+                error = Exception(f"Batch job {job_id} {status['status']}")
+                for url in chunk:
+                    yield url, None, error
+            elif time.monotonic() - started > job_timeout:
+                del active_jobs[job_id]
+                error = Exception(f"Batch job {job_id} timed out")
+                for url in chunk:
+                    yield url, None, error
+
+        if active_jobs:
+            time.sleep(poll_interval)
+
+
 if __name__ == "__main__":
     product = "https://www.amazon.com/gp/product/B002U21ZZK/"
 
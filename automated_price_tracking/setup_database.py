@@ -0,0 +1,25 @@
+"""
+Create the tracker's tables, or add what a newer version needs to existing
+ones. Run it once after installing and after every upgrade; the tracker and
+dashboard do not touch the schema themselves:
+
+    python setup_database.py
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+from database import Database
+from scraper import get_selector_templates
+
+
+def setup_database(db: Database):
+    db.setup()
+    get_selector_templates(db.engine).create_table()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    setup_database(Database(os.getenv("POSTGRES_URL")))
+    print("Database is up to date")
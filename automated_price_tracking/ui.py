@@ -1,19 +1,38 @@
-import os
+import math
+from datetime import timedelta
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 
 from utils import is_valid_url
-from database import Database
+from dashboard_data import (
+    get_database,
+    load_summaries,
+    load_chart_data,
+    invalidate,
+    get_since,
+    chart_resolution,
+)
 from dotenv import load_dotenv
-from scraper import scrape_product
 
 load_dotenv()
 
+TIME_RANGES = {
+    "Last 24 hours": timedelta(days=1),
+    "Last 7 days": timedelta(days=7),
+    "Last 30 days": timedelta(days=30),
+    "Last year": timedelta(days=365),
+    "All time": None,
+}
+RESOLUTION_LABELS = {
+    None: "Every price check",
+    "hour": "Hourly closing prices",
+    "day": "Daily closing prices",
+}
+PAGE_SIZES = [10, 25, 50]
+
 st.set_page_config(page_title="Price Tracker", page_icon="📊", layout="wide")
 
-with st.spinner("Loading database..."):
-    db = Database(os.getenv("POSTGRES_URL"))
+db = get_database()
 
 
 # Set up sidebar
@@ -28,51 +47,104 @@ with st.sidebar:
         elif not is_valid_url(product_url):
             st.error("Please enter a valid URL")
         else:
+            # The scraper is only imported when needed, to keep the dashboard's
+            # cold start fast
+            from scraper import scrape_products
+            from canonical_urls import canonicalize
+
+            # Track the page under its canonical URL, without tracking params
+            product_url = canonicalize(product_url)
             db.add_product(product_url)
             with st.spinner("Added product to database. Scraping product data..."):
-                product_data = scrape_product(product_url)
+                _, product_data, error = next(scrape_products([product_url]))
+            if error:
+                st.error(f"Error scraping product: {error}")
+            else:
                 db.add_price(product_data)
-            st.success("Product is now being tracked!")
+                st.success("Product is now being tracked!")
+            invalidate()
+
+    st.markdown("---")
+    if st.button("Refresh all prices"):
+        from scraper import scrape_products
+
+        with st.spinner("Scraping all tracked products..."):
+            failed, scraped = [], []
+            for url, product_data, error in scrape_products(
+                [product.url for product in db.get_all_products()]
+            ):
+                if error:
+                    failed.append(url)
+                else:
+                    scraped.append(product_data)
+            db.add_prices(scraped)
+        invalidate()
+        if failed:
+            st.warning(f"Could not refresh {len(failed)} product(s)")
+        else:
+            st.success("All prices refreshed!")
 
 # Main content
 st.title("Price Tracker Dashboard")
 st.markdown("## Tracked Products")
 
-# Get all products and their price histories
-products = db.get_all_products()
+col1, col2, col3 = st.columns([2, 2, 1])
+with col1:
+    search = st.text_input("Search products")
+with col2:
+    time_range = st.selectbox(
+        "Time range", list(TIME_RANGES), index=list(TIME_RANGES).index("All time")
+    )
+with col3:
+    page_size = st.selectbox("Products per page", PAGE_SIZES)
+since = get_since(TIME_RANGES[time_range])
+
+# Get the latest details of every product
+summaries = load_summaries()
+if search:
+    summaries = [s for s in summaries if search.lower() in s.name.lower()]
+
+# Only the products on the current page are rendered
+page_count = max(1, math.ceil(len(summaries) / page_size))
+page = st.number_input("Page", min_value=1, max_value=page_count, value=1)
+st.caption(f"Page {page} of {page_count} · {len(summaries)} products")
 
 # Create a card for each product
-for product in products:
-    price_history = db.get_price_history(product.url)
-    if price_history:
-        # Create DataFrame for plotting
-        df = pd.DataFrame(
-            [
-                {"timestamp": ph.timestamp, "price": ph.price, "name": ph.name}
-                for ph in price_history
-            ]
-        )
-
-        # Create a card-like container for each product
-        with st.expander(df["name"][0], expanded=False):
-            st.markdown("---")
-            col1, col2 = st.columns([1, 3])
-
-            with col1:
-                if price_history[0].main_image_url:
-                    st.image(price_history[0].main_image_url, width=200)
-                st.metric(
-                    label="Current Price",
-                    value=f"{price_history[0].price} {price_history[0].currency}",
-                )
+for summary in summaries[(page - 1) * page_size : page * page_size]:
+    resolution = chart_resolution(summary, since)
+
+    # Create a card-like container for each product
+    with st.expander(summary.name, expanded=False):
+        st.markdown("---")
+        col1, col2 = st.columns([1, 3])
+
+        with col1:
+            if summary.main_image_url:
+                st.image(summary.main_image_url, width=200)
+            st.metric(
+                label="Current Price",
+                value=f"{summary.latest_price} {summary.currency}",
+            )
+            st.caption(
+                f"Low {summary.min_price} · High {summary.max_price} · "
+                f"{summary.price_count} prices stored"
+            )
 
-            with col2:
+        with col2:
+            df = load_chart_data(
+                summary.url, resolution, since, summary.latest_timestamp
+            )
+            if df.empty:
+                st.info("No prices recorded in this time range")
+            else:
                 # Create price history plot
                 fig = px.line(
                     df,
                     x="timestamp",
                     y="price",
                     title=None,
+                    # A price holds until the next one was recorded
+                    line_shape="hv",
                 )
                 fig.update_layout(
                     xaxis_title=None,
@@ -84,3 +156,4 @@ for product in products:
                 fig.update_xaxes(tickformat="%Y-%m-%d %H:%M", tickangle=45)
                 fig.update_yaxes(tickprefix="$", tickformat=".2f")
                 st.plotly_chart(fig, use_container_width=True)
+                st.caption(RESOLUTION_LABELS[resolution])
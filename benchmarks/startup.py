@@ -0,0 +1,140 @@
+"""
+Cold-start benchmark of the entry points of the price tracker and the
+competitor monitor.
+
+Every entry point is imported in a fresh interpreter with `-X importtime`,
+against a database prepared by the projects' setup steps. Importing should
+only load code: no database round trips and no Firecrawl client. The price
+dashboard is a Streamlit script, so its import also renders the first page
+once in bare mode.
+
+    python startup.py
+    python startup.py --runs 10
+
+Without POSTGRES_URL a temporary SQLite file is used. The median import time
+and slowest imports of every entry point are printed, followed by the results
+as run_benchmarks.py stages on a single JSON line.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PRICE = ROOT / "automated_price_tracking"
+COMPETITOR = ROOT / "competitor-price-monitor" / "src"
+
+# Stage name: (project directory, module)
+ENTRY_POINTS = {
+    "price check_prices": (PRICE, "check_prices"),
+    "price ui": (PRICE, "ui"),
+    "competitor check_prices": (COMPETITOR, "check_prices"),
+    "competitor app": (COMPETITOR, "app"),
+    "competitor compact_prices": (COMPETITOR, "compact_prices"),
+}
+SETUP_COMMANDS = [(PRICE, "setup_database.py"), (COMPETITOR, "database.py")]
+
+# Imported in the child process; counts the statements sent by any engine
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+round_trips = 0
+def count(*args):
+    global round_trips
+    round_trips += 1
+event.listen(Engine, "before_cursor_execute", count)
+import {module}
+elapsed = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+peak_mib = peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+print(json.dumps([elapsed, round_trips, peak_mib]))
+"""
+
+
+def parse_importtime(stderr: str, module: str) -> list:
+    """
+    (cumulative seconds, package) of the imports done by the entry point's
+    module and of the other top-level imports, slowest first
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if cumulative.strip().isdigit() and depth <= 1 and name != module:
+            imports.append((int(cumulative) / 1e6, name))
+    return sorted(imports, reverse=True)
+
+
+def time_import(directory: Path, module: str, env: dict):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module)],
+        cwd=directory,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    seconds, round_trips, peak_rss_mib = json.loads(result.stdout.splitlines()[-1])
+    return seconds, round_trips, peak_rss_mib, parse_importtime(result.stderr, module)
+
+
+def run(env: dict, runs: int, top: int = 0) -> list:
+    """The median cold start of every entry point, as benchmark stages"""
+    for directory, script in SETUP_COMMANDS:
+        subprocess.run(
+            [sys.executable, script],
+            cwd=directory,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+
+    stages = []
+    for stage, (directory, module) in ENTRY_POINTS.items():
+        samples = [time_import(directory, module, env) for _ in range(runs)]
+        seconds = statistics.median(sample[0] for sample in samples)
+        stages.append(
+            {
+                "stage": stage,
+                "seconds": seconds,
+                "round_trips": max(sample[1] for sample in samples),
+                "items": 0,
+                "items_per_sec": None,
+                "peak_rss_mib": max(sample[2] for sample in samples),
+            }
+        )
+        if top:
+            slowest = ", ".join(
+                f"{name} {cumulative * 1000:.0f}ms"
+                for cumulative, name in samples[-1][3][:top]
+            )
+            print(f"{stage}: {seconds * 1000:.0f}ms, slowest imports: {slowest}")
+    return stages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="imports per entry point")
+    parser.add_argument(
+        "--top", type=int, default=5, help="slowest imports shown per entry point"
+    )
+    parser.add_argument("--quiet", action="store_true", help="only print the JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = {"DISCORD_WEBHOOK_URL": "", **os.environ}
+        env.setdefault("POSTGRES_URL", f"sqlite:///{tmp_dir}/startup.db")
+        stages = run(env, args.runs, 0 if args.quiet else args.top)
+    print(json.dumps(stages))
@@ -0,0 +1,226 @@
+"""
+Benchmark workloads, run by run_benchmarks.py in a separate process per project
+(both projects have modules called `database` and `check_prices`).
+
+    python workloads.py price --products 200 --samples 100
+    python workloads.py competitor --products 20 --competitors 5
+
+FIRECRAWL_API_URL and POSTGRES_URL must point at a fake Firecrawl server and a
+disposable database; the database tables are emptied first. The results of
+every stage are printed as a single JSON line.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ROOT = Path(__file__).resolve().parent.parent
+PROJECTS = {
+    "price": ROOT / "automated_price_tracking",
+    "competitor": ROOT / "competitor-price-monitor" / "src",
+}
+
+# Number of statements sent to the database by any engine in this process
+round_trips = 0
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_round_trip(*args):
+    global round_trips
+    round_trips += 1
+
+
+def peak_rss_mib() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def measure(results: list, name: str, fn, items=lambda result: 0):
+    """Run one stage with its output silenced and record its metrics"""
+    trips_before = round_trips
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+    count = items(result)
+    results.append(
+        {
+            "stage": name,
+            "seconds": elapsed,
+            "round_trips": round_trips - trips_before,
+            "items": count,
+            "items_per_sec": count / elapsed if count else None,
+            "peak_rss_mib": peak_rss_mib(),
+        }
+    )
+    return result
+
+
+def price_tracker(args) -> list:
+    from database import Database
+    from setup_database import setup_database
+
+    results = []
+    db = Database(os.getenv("POSTGRES_URL"))
+    setup_database(db)
+    db.remove_all_products()
+
+    # M hourly samples per product, ending an hour ago
+    rng = random.Random(0)
+    start = datetime.utcnow() - timedelta(hours=args.samples)
+    urls = [f"https://www.example.com/product/{i}" for i in range(args.products)]
+    records = [
+        {
+            "url": url,
+            "name": f"Product {i}",
+            "price": round(rng.uniform(10, 1000), 2),
+            "currency": "USD",
+            "main_image_url": None,
+            "timestamp": start + timedelta(hours=j),
+        }
+        for j in range(args.samples)
+        for i, url in enumerate(urls)
+    ]
+    measure(
+        results,
+        "seed add_prices",
+        lambda: db.add_prices(records),
+        lambda inserted: inserted,
+    )
+    single = [
+        {**record, "timestamp": record["timestamp"] + timedelta(minutes=30)}
+        for record in records[: min(200, len(records))]
+    ]
+    measure(
+        results,
+        "add_price loop",
+        lambda: [db.add_price(record) for record in single],
+        len,
+    )
+
+    # The dashboard caches work without a Streamlit server, but warn about it
+    from streamlit.runtime.caching import cache_data_api
+
+    logging.getLogger(cache_data_api.__name__).setLevel(logging.ERROR)
+    import dashboard_data
+
+    summaries = measure(
+        results, "dashboard summaries", dashboard_data.load_summaries, len
+    )
+
+    def load_first_page():
+        charts = [
+            dashboard_data.load_chart_data(
+                summary.url,
+                dashboard_data.chart_resolution(summary, None),
+                None,
+                summary.latest_timestamp,
+            )
+            for summary in summaries[:10]
+        ]
+        return sum(len(chart) for chart in charts)
+
+    measure(results, "dashboard first page", load_first_page, lambda points: points)
+
+    import check_prices
+
+    measure(
+        results,
+        "check_prices",
+        lambda: asyncio.run(check_prices.check_prices()),
+        lambda _: args.products,
+    )
+    return results
+
+
+def competitor_monitor(args) -> list:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base, Competitor, Product
+    from scraper import get_selector_templates
+
+    results = []
+    engine = create_engine(os.getenv("POSTGRES_URL"))
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    get_selector_templates(engine).create_table()
+    Session = sessionmaker(bind=engine)
+
+    def seed():
+        session = Session()
+        for i in range(args.products):
+            product = Product(name=f"Product {i}", your_price=100.0)
+            product.competitors = [
+                Competitor(
+                    url=f"https://www.example.com/competitor/{i}/{j}",
+                    name=f"Competitor {j} of product {i}",
+                    current_price=100.0,
+                )
+                for j in range(args.competitors)
+            ]
+            session.add(product)
+        session.commit()
+        session.close()
+        return args.products * (args.competitors + 1)
+
+    measure(results, "seed", seed, lambda rows: rows)
+
+    import check_prices
+
+    measure(
+        results,
+        "update_competitor_prices",
+        check_prices.update_competitor_prices,
+        lambda _: args.products * args.competitors,
+    )
+
+    from streamlit.runtime.caching import cache_data_api
+
+    logging.getLogger(cache_data_api.__name__).setLevel(logging.ERROR)
+    import app
+
+    def load_first_page():
+        # The data app.main() renders on a cold cache
+        app.invalidate()
+        app.count_products()
+        products = app.load_products(1, app.PAGE_SIZES[0])
+        return sum(len(product.competitors) for product in products)
+
+    measure(results, "app first page", load_first_page, lambda rows: rows)
+
+    import report
+
+    measure(
+        results,
+        "competitive position report",
+        lambda: report.build_report(engine),
+        lambda _: args.products * args.competitors,
+    )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run one benchmark workload")
+    parser.add_argument("project", choices=list(PROJECTS))
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--competitors", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(PROJECTS[args.project]))
+    workload = price_tracker if args.project == "price" else competitor_monitor
+    print(json.dumps(workload(args)))
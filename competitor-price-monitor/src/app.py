@@ -1,22 +1,89 @@
-import os
+import math
 import time
 import webbrowser
 
 from dotenv import load_dotenv
-from scraper import scrape_competitor_product
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from sqlalchemy.orm import selectinload
 from urllib.parse import urlparse
 import streamlit as st
-from database import Base, Competitor, Product
+from database import (
+    Competitor,
+    CompetitorPrice,
+    Product,
+    get_engine,
+    get_session_maker,
+)
 
 # Load environment variables
 load_dotenv()
 
 # Database setup
-engine = create_engine(os.getenv("POSTGRES_URL"))
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+# Created once per server process, not on every rerun
+Session = get_session_maker()
+
+PAGE_SIZES = [10, 25, 50]
+# Seconds the product list is cached, to pick up prices written by check_prices
+PRODUCTS_TTL = 300
+# Days of price history shown in the competitor trend lines
+TREND_DAYS = 30
+
+
+@st.cache_data(ttl=PRODUCTS_TTL, show_spinner=False)
+def count_products() -> int:
+    with Session() as session:
+        return session.query(Product).count()
+
+
+@st.cache_data(ttl=PRODUCTS_TTL, show_spinner=False)
+def load_products(page: int, page_size: int) -> list[Product]:
+    """Load one page of products and their competitors in two queries"""
+    with Session() as session:
+        return (
+            session.query(Product)
+            .options(selectinload(Product.competitors))
+            .order_by(Product.name, Product.id)
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+            .all()
+        )
+
+
+@st.cache_data(ttl=PRODUCTS_TTL, show_spinner=False)
+def load_trends(product_id: str, days: int = TREND_DAYS) -> dict:
+    """
+    Prices of all of a product's competitors over the last `days` days, oldest
+    first, keyed by competitor id. A single range scan of the product's index.
+    """
+    since = datetime.utcnow() - timedelta(days=days)
+    query = (
+        select(CompetitorPrice.competitor_id, CompetitorPrice.price)
+        .where(CompetitorPrice.product_id == product_id)
+        .where(CompetitorPrice.checked_at >= since)
+        .order_by(CompetitorPrice.checked_at)
+    )
+    trends = {}
+    with Session() as session:
+        for competitor_id, price in session.execute(query):
+            trends.setdefault(competitor_id, []).append(price)
+    return trends
+
+
+@st.cache_data(ttl=PRODUCTS_TTL, show_spinner=False)
+def load_report():
+    """The competitive position of every product, see report.py"""
+    from report import build_report
+
+    return build_report(get_engine())
+
+
+def invalidate():
+    """Drop the cached product list after products or competitors changed"""
+    count_products.clear()
+    load_products.clear()
+    load_trends.clear()
+    load_report.clear()
 
 
 def add_product():
@@ -32,6 +99,7 @@ def add_product():
             session.add(product)
             session.commit()
             session.close()
+            invalidate()
             st.success(f"Added product: {name}")
             return True
     return False
@@ -53,6 +121,11 @@ def display_competitor_metrics(product, comp):
         )
     with cols[1]:
         st.markdown(f"**🕒 Checked:** {comp.last_checked.strftime('%Y-%m-%d %H:%M')}")
+        if comp.last_status == "error":
+            st.caption(
+                f"⚠️ Last {comp.consecutive_failures} refresh(es) failed: "
+                f"{comp.last_error}"
+            )
     with cols[2]:
         st.button(
             "Visit product",
@@ -105,13 +178,33 @@ def display_competitors(product):
     """Display all competitors for a product"""
     if product.competitors:
         with st.expander("View competitors", expanded=False):
+            trends = load_trends(product.id)
+            st.dataframe(
+                [
+                    {
+                        "competitor": urlparse(comp.url).netloc,
+                        "price": comp.current_price,
+                        "trend": trends.get(comp.id, []),
+                    }
+                    for comp in product.competitors
+                ],
+                column_config={
+                    "competitor": "Competitor",
+                    "price": st.column_config.NumberColumn("Price", format="$%.2f"),
+                    "trend": st.column_config.LineChartColumn(
+                        f"Last {TREND_DAYS} days"
+                    ),
+                },
+                hide_index=True,
+                use_container_width=True,
+            )
             for comp in product.competitors:
                 display_competitor_metrics(product, comp)
     else:
         st.info("No competitors added yet")
 
 
-def add_competitor_form(product, session):
+def add_competitor_form(product):
     """Form to add a new competitor"""
     with st.expander("Add new competitor", expanded=False):
         with st.form(f"add_competitor_{product.id}"):
@@ -123,6 +216,12 @@ def add_competitor_form(product, session):
                 )
 
             if submit:
+                # The scraper is only imported when needed, to keep the app's
+                # cold start fast
+                from scraper import scrape_competitor_product
+                from canonical_urls import canonicalize
+
+                competitor_url = canonicalize(competitor_url)
                 try:
                     with st.spinner("Fetching competitor data..."):
                         data = scrape_competitor_product(competitor_url)
@@ -134,8 +233,18 @@ def add_competitor_form(product, session):
                             image_url=data.get("image_url"),
                             last_checked=data["last_checked"],
                         )
-                        session.add(competitor)
-                        session.commit()
+                        with Session.begin() as session:
+                            session.add(competitor)
+                            session.flush()
+                            session.add(
+                                CompetitorPrice(
+                                    product_id=product.id,
+                                    competitor_id=competitor.id,
+                                    price=data["price"],
+                                    checked_at=data["last_checked"],
+                                )
+                            )
+                        invalidate()
                         st.success("✅ Competitor added successfully!")
 
                         # Refresh the page
@@ -145,14 +254,67 @@ def add_competitor_form(product, session):
                     st.error(f"❌ Error adding competitor: {str(e)}")
 
 
+def display_report():
+    """Display the competitive position of all products"""
+    report = load_report()
+    priced = report[report["competitors"] > 0]
+    if priced.empty:
+        st.info("Add competitors to see where your prices stand.")
+        return
+
+    cols = st.columns(3)
+    cols[0].metric("Products with competitors", len(priced))
+    cols[1].metric("Undercut by a competitor", int((priced["undercutting"] > 0).sum()))
+    cols[2].metric(
+        "Median percentile rank", f"{priced['percentile_rank'].median():.0f}"
+    )
+    st.caption(
+        "Percentile rank: the share of competitors cheaper than you, "
+        "0 means you are the cheapest."
+    )
+
+    st.dataframe(
+        report.drop(columns="product_id"),
+        column_config={
+            "name": "Product",
+            "your_price": st.column_config.NumberColumn("Your price", format="$%.2f"),
+            "competitors": "Competitors",
+            "min_price": st.column_config.NumberColumn("Min", format="$%.2f"),
+            "median_price": st.column_config.NumberColumn("Median", format="$%.2f"),
+            "max_price": st.column_config.NumberColumn("Max", format="$%.2f"),
+            "spread": st.column_config.NumberColumn("Spread", format="$%.2f"),
+            "spread_pct": st.column_config.NumberColumn("Spread %", format="%.1f%%"),
+            "min_diff_pct": st.column_config.NumberColumn(
+                "Cheapest vs you", format="%+.1f%%"
+            ),
+            "percentile_rank": st.column_config.NumberColumn(
+                "Percentile rank", format="%.0f"
+            ),
+            "undercutting": "Undercutting you",
+        },
+        hide_index=True,
+        use_container_width=True,
+    )
+    st.download_button(
+        "Download CSV",
+        report.to_csv(index=False),
+        file_name="competitive_position.csv",
+        mime="text/csv",
+    )
+
+
 def delete_product(product_id: str):
     """Delete a product and all its competitors"""
     session = Session()
     product = session.query(Product).filter_by(id=product_id).first()
     if product:
+        session.execute(
+            delete(CompetitorPrice).where(CompetitorPrice.product_id == product_id)
+        )
         session.delete(product)
         session.commit()
     session.close()
+    invalidate()
 
 
 def delete_competitor(competitor_id: str):
@@ -160,9 +322,15 @@ def delete_competitor(competitor_id: str):
     session = Session()
     competitor = session.query(Competitor).filter_by(id=competitor_id).first()
     if competitor:
+        session.execute(
+            delete(CompetitorPrice).where(
+                CompetitorPrice.competitor_id == competitor_id
+            )
+        )
         session.delete(competitor)
         session.commit()
     session.close()
+    invalidate()
 
 
 def main():
@@ -170,8 +338,6 @@ def main():
     st.markdown(
         "##### Compare your product prices to competitors' prices. Input your product details and competitors' URLs to get started."
     )
-    st.markdown("### Tracked Products")
-    st.markdown("---")
 
     # Sidebar for adding new products
     with st.sidebar:
@@ -179,19 +345,32 @@ def main():
         add_product()
 
     # Main content area
-    session = Session()
-    products = session.query(Product).all()
+    total = count_products()
+    products_tab, report_tab = st.tabs(["Tracked Products", "Competitive Position"])
 
-    if not products:
-        st.info("No products added yet. Use the sidebar to add your first product.")
-    else:
-        for product in products:
-            with st.container():
-                display_product_details(product)
-                display_competitors(product)
-                add_competitor_form(product, session)
+    with products_tab:
+        if not total:
+            st.info("No products added yet. Use the sidebar to add your first product.")
+        else:
+            col1, col2 = st.columns(2)
+            with col2:
+                page_size = st.selectbox("Products per page", PAGE_SIZES)
+            page_count = max(1, math.ceil(total / page_size))
+            with col1:
+                page = st.number_input(
+                    "Page", min_value=1, max_value=page_count, value=1
+                )
+            st.caption(f"Page {page} of {page_count} · {total} products")
 
-    session.close()
+            # Only the current page is loaded and rendered
+            for product in load_products(page, page_size):
+                with st.container():
+                    display_product_details(product)
+                    display_competitors(product)
+                    add_competitor_form(product)
+
+    with report_tab:
+        display_report()
 
 
 if __name__ == "__main__":
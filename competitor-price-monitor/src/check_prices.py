@@ -1,38 +1,222 @@
 import os
-from database import Base, Product, Competitor
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from scraper import scrape_competitor_product
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from functools import cache
+from pathlib import Path
+from database import (
+    Competitor,
+    CompetitorPrice,
+    Product,
+    get_engine,
+    get_session_maker,
+)
+from refresh_schedule import next_check_at, next_interval, retry_at
+from sqlalchemy import bindparam, insert, or_, select, update
+from scraper import get_selector_templates, scrape_competitor_product
+from canonical_urls import canonicalize
+from fetch_gate import get_gate
+from firecrawl_client import get_client
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Database setup
-engine = create_engine(os.getenv("POSTGRES_URL"))
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+# Number of competitors scraped at the same time
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", "16"))
+# Scrape results are written once this many have arrived...
+COMMIT_BATCH_SIZE = int(os.getenv("COMMIT_BATCH_SIZE", "50"))
+# ...or this many seconds have passed since the last write
+COMMIT_INTERVAL = float(os.getenv("COMMIT_INTERVAL", "10"))
+# Most competitors checked in one run, most overdue first (0 means no limit)
+MAX_CHECKS_PER_RUN = int(os.getenv("MAX_CHECKS_PER_RUN", "0"))
+# "templates" extracts pages of known domains with learned selectors and only
+# falls back to LLM extraction when that fails, "llm" always uses the LLM
+EXTRACT_MODE = os.getenv("EXTRACT_MODE", "templates")
+# Validators and last extraction of every competitor page, so pages that did
+# not change since the last run are not extracted again (FETCH_GATE=off
+# disables)
+GATE_PATH = Path(__file__).resolve().parents[1] / "fetch_gate.json"
 
 
-def update_competitor_prices():
-    """Update all competitor prices"""
-    session = Session()
-    competitors = session.query(Competitor).all()
+@cache
+def get_templates():
+    if EXTRACT_MODE != "templates":
+        return None
+    return get_selector_templates(get_engine())
 
+
+def scrape_competitor(url, expected_price):
+    """Scrape one competitor page, returning (url, data, error)"""
+    try:
+        data = scrape_competitor_product(
+            url, get_templates(), expected_price, get_gate(GATE_PATH)
+        )
+        return url, data, None
+    except Exception as e:
+        return url, None, str(e)
+
+
+def save_results(results):
+    """
+    Write a batch of scrape results in one short transaction: the latest
+    state and next due time of each competitor and the new prices, appended
+    to their history. Competitors deleted while they were being scraped are
+    skipped.
+    """
+    attempted_at = datetime.utcnow()
+    updated, failed = [], []
+    for competitor, data, error in results:
+        if error is not None:
+            failures = competitor.consecutive_failures + 1
+            interval = competitor.check_interval or next_interval(None, False)
+            failed.append(
+                {
+                    "competitor_id": competitor.id,
+                    "last_attempted_at": attempted_at,
+                    "last_status": "error",
+                    "last_error": error,
+                    "consecutive_failures": failures,
+                    "next_check_at": retry_at(attempted_at, interval, failures),
+                }
+            )
+            continue
+
+        changed = competitor.current_price not in (None, data["price"])
+        interval = next_interval(competitor.check_interval, changed)
+        updated.append(
+            {
+                "competitor_id": competitor.id,
+                "current_price": data["price"],
+                "last_checked": data["last_checked"],
+                "last_attempted_at": attempted_at,
+                "last_status": "ok",
+                "last_error": None,
+                "consecutive_failures": 0,
+                "check_interval": interval,
+                "next_check_at": next_check_at(
+                    attempted_at, interval, data["price"], competitor.your_price
+                ),
+            }
+        )
+
+    competitors = Competitor.__table__
+    # The parameters of each row name the columns to set
+    update_competitor = update(competitors).where(
+        competitors.c.id == bindparam("competitor_id")
+    )
+    with get_session_maker().begin() as session:
+        if updated:
+            session.execute(update_competitor, updated)
+            # Only competitors that still exist, since a deleted one has no
+            # row for the foreign key to point at
+            existing = set(
+                session.scalars(
+                    select(competitors.c.id).where(
+                        competitors.c.id.in_([row["competitor_id"] for row in updated])
+                    )
+                )
+            )
+            prices = [
+                {
+                    "product_id": competitor.product_id,
+                    "competitor_id": competitor.id,
+                    "price": data["price"],
+                    "checked_at": data["last_checked"],
+                }
+                for competitor, data, error in results
+                if error is None and competitor.id in existing
+            ]
+            if prices:
+                session.execute(insert(CompetitorPrice), prices)
+        if failed:
+            session.execute(update_competitor, failed)
+    return len(updated), len(failed)
+
+
+def due_competitors(now: datetime, limit: int = MAX_CHECKS_PER_RUN):
+    """Competitors whose next check is due, never checked and most overdue first"""
+    with get_session_maker()() as session:
+        query = (
+            session.query(
+                Competitor.id,
+                Competitor.product_id,
+                Competitor.name,
+                Competitor.url,
+                Competitor.current_price,
+                Competitor.check_interval,
+                Competitor.consecutive_failures,
+                Product.your_price,
+            )
+            .join(Competitor.product)
+            .filter(
+                or_(Competitor.next_check_at.is_(None), Competitor.next_check_at <= now)
+            )
+            .order_by(Competitor.next_check_at.asc().nulls_first())
+        )
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+
+def update_competitor_prices(
+    workers: int = REFRESH_WORKERS,
+    batch_size: int = COMMIT_BATCH_SIZE,
+    commit_interval: float = COMMIT_INTERVAL,
+):
+    """
+    Update the prices of all competitors that are due for a check.
+
+    Competitors are scraped by a pool of `workers` threads and their results
+    are committed in small batches as they arrive, so no transaction stays
+    open during scraping and a crash only loses the unsaved batch. Each page
+    is scraped once, however many competitors (of any product, under any
+    variant of its URL) point at it.
+    """
+    competitors = due_competitors(datetime.utcnow())
+    pages = {}
     for competitor in competitors:
-        try:
-            # Scrape updated data
-            data = scrape_competitor_product(competitor.url)
+        pages.setdefault(canonicalize(competitor.url), []).append(competitor)
+
+    start = time.perf_counter()
+    succeeded = failed = 0
+    pending, last_commit = [], time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(scrape_competitor, url, same_page[0].current_price)
+            for url, same_page in pages.items()
+        ]
+        for future in as_completed(futures):
+            url, data, error = future.result()
+            for competitor in pages[url]:
+                if error is None:
+                    print(f"Updated price for {competitor.name}: ${data['price']}")
+                else:
+                    print(f"Error updating {competitor.name}: {error}")
+                pending.append((competitor, data, error))
 
-            # Update competitor
-            competitor.current_price = data["price"]
-            competitor.last_checked = data["last_checked"]
+            if (
+                len(pending) >= batch_size
+                or time.monotonic() - last_commit >= commit_interval
+            ):
+                ok, errors = save_results(pending)
+                succeeded, failed = succeeded + ok, failed + errors
+                pending, last_commit = [], time.monotonic()
 
-            print(f"Updated price for {competitor.name}: ${data['price']}")
-        except Exception as e:
-            print(f"Error updating {competitor.name}: {str(e)}")
+    if pending:
+        ok, errors = save_results(pending)
+        succeeded, failed = succeeded + ok, failed + errors
 
-    session.commit()
-    session.close()
+    print(
+        f"Refreshed {succeeded} of {len(competitors)} due competitors "
+        f"from {len(pages)} pages ({failed} failed) in "
+        f"{time.perf_counter() - start:.1f}s"
+    )
+    print(get_client().stats)
+    if get_gate(GATE_PATH) is not None:
+        get_gate(GATE_PATH).save()
+        print(get_gate(GATE_PATH).stats)
+    if get_templates() is not None:
+        print(get_templates())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+"""
+Compact the competitor price history.
+
+Old samples are downsampled to the last price of each day, and runs of the
+same price are collapsed to their first and last sample, which keeps the
+shape of every trend line. Each product is compacted in its own short
+transaction, so the job can run next to the price checker:
+
+    python compact_prices.py
+    python compact_prices.py --raw-days 7
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select
+from sqlalchemy.orm import sessionmaker
+
+from database import CompetitorPrice, Product, get_engine
+
+# Samples newer than this many days are kept at full resolution
+RAW_DAYS = 30
+DELETE_BATCH_SIZE = 1000
+
+
+def redundant_samples(samples, cutoff: datetime) -> list:
+    """
+    Ids of the samples of one competitor, ordered by time, that compaction
+    removes
+    """
+    # Keep the last sample of each day before the cutoff
+    kept, removed = [], []
+    for day, same_day in groupby(
+        samples,
+        key=lambda sample: (
+            sample.checked_at.date() if sample.checked_at < cutoff else None
+        ),
+    ):
+        same_day = list(same_day)
+        if day is None:
+            kept.extend(same_day)
+        else:
+            kept.append(same_day[-1])
+            removed.extend(sample.id for sample in same_day[:-1])
+
+    # Keep the first and last sample of each run of the same price
+    for _, run in groupby(kept, key=lambda sample: sample.price):
+        removed.extend(sample.id for sample in list(run)[1:-1])
+    return removed
+
+
+def compact_prices(engine, raw_days: int = RAW_DAYS) -> int:
+    """Compact the price history of every product, returning the rows removed"""
+    Session = sessionmaker(bind=engine)
+    cutoff = datetime.utcnow() - timedelta(days=raw_days)
+    with Session() as session:
+        product_ids = session.scalars(select(Product.id)).all()
+
+    removed = 0
+    for product_id in product_ids:
+        with Session.begin() as session:
+            samples = session.execute(
+                select(
+                    CompetitorPrice.id,
+                    CompetitorPrice.competitor_id,
+                    CompetitorPrice.price,
+                    CompetitorPrice.checked_at,
+                )
+                .where(CompetitorPrice.product_id == product_id)
+                .order_by(CompetitorPrice.competitor_id, CompetitorPrice.checked_at)
+            ).all()
+
+            ids = []
+            for _, competitor_samples in groupby(
+                samples, key=lambda sample: sample.competitor_id
+            ):
+                ids.extend(redundant_samples(competitor_samples, cutoff))
+            for i in range(0, len(ids), DELETE_BATCH_SIZE):
+                session.execute(
+                    delete(CompetitorPrice).where(
+                        CompetitorPrice.id.in_(ids[i : i + DELETE_BATCH_SIZE])
+                    )
+                )
+            removed += len(ids)
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact competitor price history")
+    parser.add_argument(
+        "--raw-days",
+        type=int,
+        default=RAW_DAYS,
+        help="keep every sample of the last N days (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    removed = compact_prices(get_engine(), args.raw_days)
+    print(f"Removed {removed} redundant price samples")
@@ -1,8 +1,25 @@
-from sqlalchemy import create_engine, Column, String, Float, DateTime, ForeignKey
+from sqlalchemy import (
+    create_engine,
+    Column,
+    String,
+    Float,
+    Integer,
+    BigInteger,
+    DateTime,
+    ForeignKey,
+    Index,
+)
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
 from datetime import datetime
+from functools import cache
+from pathlib import Path
+import os
+import sys
 import uuid
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
+from schema_upgrades import upgrade_schema as shared_upgrade_schema
+
 Base = declarative_base()
 
 
@@ -22,20 +39,71 @@ class Competitor(Base):
     __tablename__ = "competitors"
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    product_id = Column(String, ForeignKey("products.id"))
+    product_id = Column(String, ForeignKey("products.id"), index=True)
     url = Column(String, nullable=False)
     name = Column(String)
     current_price = Column(Float)
     last_checked = Column(DateTime, default=datetime.utcnow)
     image_url = Column(String)
+    # Outcome of the most recent refresh, successful or not
+    last_attempted_at = Column(DateTime)
+    last_status = Column(String)
+    last_error = Column(String)
+    consecutive_failures = Column(Integer, nullable=False, server_default="0")
+    # Adaptive refresh schedule, see refresh_schedule.py
+    check_interval = Column(Float)
+    next_check_at = Column(DateTime, index=True)
     product = relationship("Product", back_populates="competitors")
 
 
+class CompetitorPrice(Base):
+    """
+    One scraped competitor price. Rows are only ever appended by the price
+    checker and removed by compact_prices.py.
+    """
+
+    __tablename__ = "competitor_prices"
+    __table_args__ = (
+        # product_id is copied from the competitor so the trends of all of a
+        # product's competitors are one range scan of this index
+        Index("ix_competitor_prices_product_id_checked_at", "product_id", "checked_at"),
+    )
+
+    # SQLite only auto-increments INTEGER PRIMARY KEY columns
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    product_id = Column(String, ForeignKey("products.id"), nullable=False)
+    competitor_id = Column(String, ForeignKey("competitors.id"), nullable=False)
+    price = Column(Float, nullable=False)
+    checked_at = Column(DateTime, nullable=False)
+
+
+def upgrade_schema(engine):
+    """
+    Create missing tables and add the columns and indexes introduced after
+    they were created
+    """
+    return shared_upgrade_schema(engine, Base.metadata)
+
+
+@cache
+def get_engine():
+    """The engine of POSTGRES_URL, created on first use and shared afterwards"""
+    return create_engine(os.getenv("POSTGRES_URL"))
+
+
+@cache
+def get_session_maker():
+    return sessionmaker(bind=get_engine())
+
+
 if __name__ == "__main__":
-    import os
+    # The one-time setup step: run after installing and after every upgrade,
+    # the app and the scripts do not touch the schema themselves
     from dotenv import load_dotenv
+    from scraper import get_selector_templates
 
     load_dotenv()
 
-    engine = create_engine(os.getenv("POSTGRES_URL"))
-    Base.metadata.create_all(engine)
+    upgrade_schema(get_engine())
+    get_selector_templates(get_engine()).create_table()
+    print("Database is up to date")
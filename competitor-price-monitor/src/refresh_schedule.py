@@ -0,0 +1,58 @@
+"""
+Adaptive refresh intervals for competitor price checks.
+
+Every competitor has its own check interval. It shrinks when a check finds a
+new price and grows while the price stays the same, within MIN/MAX bounds.
+Competitors priced close to your own price are checked more often, since a
+small move there changes who is cheaper.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+MIN_INTERVAL_HOURS = float(os.getenv("MIN_CHECK_INTERVAL_HOURS", "1"))
+MAX_INTERVAL_HOURS = float(os.getenv("MAX_CHECK_INTERVAL_HOURS", "168"))
+# Interval of competitors that have not been checked yet
+DEFAULT_INTERVAL_HOURS = 6
+
+# Interval multipliers after a check that did or did not find a new price
+CHANGED_FACTOR = 0.5
+UNCHANGED_FACTOR = 1.5
+
+# Competitors within this fraction of your price are checked BOOST times as often
+CLOSE_PRICE_MARGIN = 0.05
+CLOSE_PRICE_BOOST = 2
+
+
+def clamp(hours: float) -> float:
+    return min(max(hours, MIN_INTERVAL_HOURS), MAX_INTERVAL_HOURS)
+
+
+def next_interval(interval: Optional[float], changed: bool) -> float:
+    """Adapt a competitor's interval (in hours) to the outcome of a check"""
+    interval = interval or DEFAULT_INTERVAL_HOURS
+    return clamp(interval * (CHANGED_FACTOR if changed else UNCHANGED_FACTOR))
+
+
+def next_check_at(
+    checked_at: datetime,
+    interval: float,
+    price: Optional[float],
+    your_price: Optional[float],
+) -> datetime:
+    """When a competitor is due again, boosted if its price is close to yours"""
+    if price is not None and your_price:
+        if abs(price - your_price) / your_price <= CLOSE_PRICE_MARGIN:
+            interval = clamp(interval / CLOSE_PRICE_BOOST)
+    return checked_at + timedelta(hours=interval)
+
+
+def retry_at(checked_at: datetime, interval: float, failures: int) -> datetime:
+    """
+    When to retry a failed check: after the minimum interval, doubling with
+    every consecutive failure but never later than the regular interval
+    """
+    # The exponent is capped so long failure streaks do not overflow a float
+    hours = min(MIN_INTERVAL_HOURS * 2 ** min(failures - 1, 16), interval)
+    return checked_at + timedelta(hours=clamp(hours))
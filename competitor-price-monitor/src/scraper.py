@@ -2,13 +2,24 @@ import warnings
 
 warnings.filterwarnings("ignore")
 
+import sys
+import time
 from datetime import datetime
-from firecrawl import FirecrawlApp
+from pathlib import Path
+from typing import Optional
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 load_dotenv()
-app = FirecrawlApp()
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
+from fetch_gate import FetchGate
+from firecrawl_client import get_client
+from selector_templates import SelectorTemplates
+
+# A page with unchanged content is only reused if its last extracted price is
+# still in it, so a bot challenge page is never mistaken for the product
+GATE_KEY_FIELDS = ("price",)
 
 
 class CompetitorProduct(BaseModel):
@@ -19,27 +30,69 @@ class CompetitorProduct(BaseModel):
     image_url: str | None = Field(None, description="URL of the main product image")
 
 
-def scrape_competitor_product(url: str) -> dict:
+def get_selector_templates(engine) -> SelectorTemplates:
+    return SelectorTemplates(engine, CompetitorProduct)
+
+
+def scrape_competitor_product(
+    url: str,
+    templates: Optional[SelectorTemplates] = None,
+    expected_price: Optional[float] = None,
+    gate: Optional[FetchGate] = None,
+) -> dict:
     """
-    Scrape product information from a competitor's webpage
+    Scrape product information from a competitor's webpage.
+
+    With `templates`, a page of a domain whose template has been learned is
+    only fetched as HTML and extracted locally; an LLM extract is used when
+    that fails or the price is far from `expected_price`, and teaches the
+    template from the page.
+
+    With `gate`, the page is fetched directly first and its last extraction
+    is reused if it has not changed since.
     """
-    extracted_data = app.scrape_url(
-        url,
-        params={
-            "formats": ["extract"],
-            "extract": {
-                "schema": CompetitorProduct.model_json_schema(),
-            },
-        },
-    )
+    check = gate.check(url, GATE_KEY_FIELDS) if gate is not None else None
+    if check is not None and check.unchanged:
+        gate.record(check, check.result)
+        data = dict(check.result)
+    else:
+        start = time.perf_counter()
+        data = _extract_competitor_product(url, templates, expected_price)
+        if check is not None:
+            gate.record(check, dict(data), time.perf_counter() - start)
 
     # Add timestamp to the extracted data
-    data = extracted_data["extract"]
     data["last_checked"] = datetime.utcnow()
 
     return data
 
 
+def _extract_competitor_product(url, templates, expected_price) -> dict:
+    learn = templates is not None and templates.enabled
+    data = None
+    if learn and templates.has(url):
+        page = get_client().scrape_url(url, params={"formats": ["rawHtml"]})
+        data = templates.extract(
+            url, page.get("rawHtml"), expected={"price": expected_price}
+        )
+
+    if data is None:
+        extracted_data = get_client().scrape_url(
+            url,
+            params={
+                "formats": ["extract", "rawHtml"] if learn else ["extract"],
+                "extract": {
+                    "schema": CompetitorProduct.model_json_schema(),
+                },
+            },
+        )
+        data = extracted_data["extract"]
+        if learn:
+            templates.learn(url, extracted_data.get("rawHtml"), data)
+
+    return data
+
+
 if __name__ == "__main__":
     print(
         scrape_competitor_product(
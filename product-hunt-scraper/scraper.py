@@ -1,13 +1,18 @@
 import json
+import sys
 import boto3
 
-from firecrawl import FirecrawlApp
+from pathlib import Path
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from datetime import datetime
 
 load_dotenv()
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared"))
+from fetch_gate import get_gate
+from firecrawl_client import get_client
+
 
 class Product(BaseModel):
     name: str = Field(description="The name of the product")
@@ -31,21 +36,35 @@ class YesterdayTopProducts(BaseModel):
 
 
 BASE_URL = "https://www.producthunt.com"
+# Validators and last extraction of the home page
+GATE_PATH = Path(__file__).resolve().parent / "fetch_gate.json"
 
 
 def get_yesterday_top_products():
-    app = FirecrawlApp()
-
-    data = app.scrape_url(
-        BASE_URL,
-        params={
-            "formats": ["extract"],
-            "extract": {
-                "schema": YesterdayTopProducts.model_json_schema(),
-                "prompt": "Extract the top products listed under the 'Yesterday's Top Products' section. There will be exactly 5 products.",
+    app = get_client()
+
+    def extract():
+        return app.scrape_url(
+            BASE_URL,
+            params={
+                "formats": ["extract"],
+                "extract": {
+                    "schema": YesterdayTopProducts.model_json_schema(),
+                    "prompt": (
+                        "Extract the top products listed under the 'Yesterday's "
+                        "Top Products' section. There will be exactly 5 products."
+                    ),
+                },
             },
-        },
-    )
+        )
+
+    # The extraction is reused when the page has not changed since the last run
+    gate = get_gate(GATE_PATH)
+    if gate is None:
+        data = extract()
+    else:
+        data = gate.get(BASE_URL, extract)
+        gate.save()
 
     return data["extract"]["products"]
 
@@ -66,3 +85,6 @@ def save_yesterday_top_products():
 
 if __name__ == "__main__":
     save_yesterday_top_products()
+    print(get_client().stats)
+    if get_gate(GATE_PATH) is not None:
+        print(get_gate(GATE_PATH).stats)
@@ -1,42 +1,245 @@
+"""
+In-process scheduler for the scrapers.
+
+Every job runs on its own cadence in a thread pool (or a process pool), so a
+slow job never delays the others and the event loop only keeps time. A job is
+never run twice at once: scheduled times that pass while it is still running
+are missed, and its catch-up policy decides what happens to them:
+
+- "skip": wait for the next scheduled time (default)
+- "once": run once right away, however many were missed
+- "all": run once for every missed time, back to back
+
+Each run after the first is delayed by a random jitter of up to `jitter`
+times the interval, so jobs with the same cadence do not all hit their sites
+at once. The scheduler records how long every run took and how much later
+than due it started in its worker (lag), which shows when the event loop is
+blocked or the pools are busy.
+
+    python async_scheduler.py
+    python async_scheduler.py --demo 20
+"""
+
+import argparse
 import asyncio
+import os
+import random
+import statistics
 import time
-from firecrawl_scraper import save_firecrawl_news_data
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Optional
+
+# Jobs running at the same time in each pool
+MAX_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+# Largest random delay of a run, as a fraction of its job's interval
+JITTER = float(os.getenv("SCHEDULER_JITTER", "0.05"))
+CATCH_UP = os.getenv("SCHEDULER_CATCH_UP", "skip")
+CATCH_UP_POLICIES = ["skip", "once", "all"]
 
 
-async def schedule_scraper(interval_hours: float = 1):
+def _timed_call(func):
     """
-    Schedule the scraper to run at specified intervals
+    Run `func` in a worker, returning when it started with its result or
+    exception, so the time it waited for a worker counts as lag
+    """
+    started = time.time()
+    try:
+        return started, func(), None
+    except Exception as e:
+        return started, None, e
+
+
+@dataclass
+class Job:
+    func: Callable
+    interval_hours: float
+    name: str
+    jitter: float = JITTER
+    catch_up: str = CATCH_UP
+    use_process: bool = False
+    runs: int = 0
+    failures: int = 0
+    missed: int = 0
+    # Seconds of every run, and seconds every run started after its time
+    durations: list = field(default_factory=list)
+    lags: list = field(default_factory=list)
+
+    @property
+    def interval(self) -> float:
+        return self.interval_hours * 3600
+
+    def __str__(self):
+        if not self.runs:
+            return f"{self.name}: no runs yet, {self.missed} missed"
+        return (
+            f"{self.name}: {self.runs} runs ({self.failures} failed, "
+            f"{self.missed} missed), "
+            f"{statistics.mean(self.durations):.2f}s average and "
+            f"{max(self.durations):.2f}s longest run, "
+            f"{statistics.mean(self.lags) * 1000:.0f}ms average and "
+            f"{max(self.lags) * 1000:.0f}ms largest lag"
+        )
+
+
+class Scheduler:
+    """
+    Runs jobs added with `add_job` until `run` is cancelled or its duration
+    is over.
 
     Args:
-        interval_hours (float): Hours between each scrape (can be decimal for shorter periods)
+        max_workers (int): Jobs running at the same time, per pool
     """
-    while True:
-        try:
-            print(f"Starting scrape at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-            # Run the scraper
-            filename = save_firecrawl_news_data()
-            print(f"Data saved to {filename}")
 
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.max_workers = max_workers
+        self.jobs = []
+
+    def add_job(
+        self,
+        func: Callable,
+        interval_hours: float,
+        name: Optional[str] = None,
+        jitter: float = JITTER,
+        catch_up: str = CATCH_UP,
+        use_process: bool = False,
+    ) -> Job:
+        """
+        Run `func` every `interval_hours` hours (can be decimal for shorter
+        periods), starting right away; later runs are jittered. Functions run
+        in a process pool with `use_process` must be importable, like the
+        scrapers' save functions.
+        """
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(
+                f"Unknown catch-up policy {catch_up!r}, expected one of "
+                f"{CATCH_UP_POLICIES}"
+            )
+        job = Job(
+            func, interval_hours, name or func.__name__, jitter, catch_up, use_process
+        )
+        self.jobs.append(job)
+        return job
+
+    async def _run_once(self, job: Job, executor, due: float):
+        """Run a job once, `due` being the time.time() it was due at"""
+        loop = asyncio.get_running_loop()
+        print(f"Starting {job.name} at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        try:
+            started, result, error = await loop.run_in_executor(
+                executor, partial(_timed_call, job.func)
+            )
         except Exception as e:
-            print(f"Error during scraping: {e}")
+            # The job could not be sent to its worker
+            started, result, error = time.time(), None, e
+        if error is None:
+            print(f"{job.name} finished: {result}")
+        else:
+            job.failures += 1
+            print(f"Error during {job.name}: {error}")
+        # Runs cancelled when the scheduler stops are not counted
+        job.runs += 1
+        job.lags.append(max(0.0, started - due))
+        job.durations.append(time.time() - started)
+
+    async def _run_job(self, job: Job, executor):
+        loop = asyncio.get_running_loop()
+        scheduled = loop.time()
+        first = True
+        while True:
+            jitter = 0 if first else random.uniform(0, job.jitter * job.interval)
+            first = False
+            # Missed runs caught up on are due right away
+            due = max(scheduled + jitter, loop.time())
+            await asyncio.sleep(due - loop.time())
+            # Lag is measured in the worker, against the wall clock
+            await self._run_once(job, executor, time.time() - (loop.time() - due))
+
+            scheduled += job.interval
+            # Scheduled times that passed while the job was running
+            missed = max(0, int((loop.time() - scheduled) // job.interval) + 1)
+            if missed and job.catch_up == "skip":
+                scheduled += missed * job.interval
+                job.missed += missed
+            elif missed and job.catch_up == "once":
+                scheduled += (missed - 1) * job.interval
+                job.missed += missed - 1
+
+    async def run(self, duration: Optional[float] = None):
+        """Run all jobs, forever or for `duration` seconds"""
+        with ThreadPoolExecutor(self.max_workers) as threads, ProcessPoolExecutor(
+            self.max_workers
+        ) as processes:
+            tasks = [
+                asyncio.create_task(
+                    self._run_job(job, processes if job.use_process else threads)
+                )
+                for job in self.jobs
+            ]
+            try:
+                await asyncio.wait_for(asyncio.gather(*tasks), duration)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                for task in tasks:
+                    task.cancel()
+                self.print_stats()
+
+    def print_stats(self):
+        for job in self.jobs:
+            print(job)
 
-        # Wait for the specified interval
-        await asyncio.sleep(interval_hours * 20)  # Convert hours to seconds
 
+def demo(seconds: float):
+    """
+    Run two jobs on a seconds scale: a fast one and a slow one that takes
+    longer than its interval and misses runs
+    """
+
+    def fast():
+        time.sleep(0.2)
+        return "fast done"
+
+    def slow():
+        time.sleep(2.5)
+        return "slow done"
 
-async def main():
-    # Create tasks for different scheduling intervals
-    tasks = [
-        schedule_scraper(interval_hours=1),  # Run every hour
-        # Add more tasks with different intervals if needed
-        # schedule_scraper(interval_hours=0.5),  # Run every 30 minutes
-        # schedule_scraper(interval_hours=2),    # Run every 2 hours
-    ]
+    scheduler = Scheduler()
+    scheduler.add_job(fast, interval_hours=1 / 3600)
+    scheduler.add_job(slow, interval_hours=1 / 3600, catch_up="once")
+    asyncio.run(scheduler.run(seconds))
 
-    # Run all tasks concurrently
-    await asyncio.gather(*tasks)
+
+def main():
+    from firecrawl_scraper import save_firecrawl_news_data
+    from hn_crawler import run_crawl
+
+    scheduler = Scheduler()
+    scheduler.add_job(save_firecrawl_news_data, interval_hours=1)  # Every hour
+    # The top pages, newest and ask, crawled without Firecrawl
+    scheduler.add_job(run_crawl, interval_hours=1)
+    # Add more jobs with their own intervals if needed
+    # from bs4_scraper import save_news_data
+    # scheduler.add_job(save_news_data, interval_hours=0.5)  # Every 30 minutes
+    try:
+        asyncio.run(scheduler.run())
+    except KeyboardInterrupt:
+        # The stats were printed when the scheduler stopped
+        pass
 
 
 if __name__ == "__main__":
-    # Run the async scheduler
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Run the scrapers on a schedule")
+    parser.add_argument(
+        "--demo",
+        type=float,
+        metavar="SECONDS",
+        help="run two sleeping jobs on a seconds scale and exit",
+    )
+    args = parser.parse_args()
+
+    if args.demo is not None:
+        demo(args.demo)
+    else:
+        main()
@@ -0,0 +1,69 @@
+"""
+Compare the parser backends of bs4_scraper on a saved Hacker News page.
+
+Every installed backend parses the fixture page --repeat times. Items/sec
+comes from those runs; the peak memory of one parse is measured separately
+with tracemalloc, which slows parsing down. tracemalloc only sees memory
+allocated through Python, not the C trees of lxml and selectolax. All backends
+must extract the same stories. Install lxml and selectolax to compare them:
+
+    pip install lxml selectolax
+
+    python bench_parsers.py
+    python bench_parsers.py --repeat 200 --page fixtures/hn_front_page.html
+"""
+
+import argparse
+import time
+import tracemalloc
+from pathlib import Path
+
+from bs4_scraper import available_parsers, parse_news_data
+
+FIXTURE = Path(__file__).resolve().parent / "fixtures" / "hn_front_page.html"
+
+
+def measure(html_content: str, parser: str, repeat: int) -> dict:
+    items = parse_news_data(html_content, parser)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse_news_data(html_content, parser)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    parse_news_data(html_content, parser)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "items": items,
+        "ms_per_page": elapsed / repeat * 1000,
+        "items_per_sec": len(items) * repeat / elapsed,
+        "peak_kib": peak / 1024,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark HN parser backends")
+    parser.add_argument("--page", default=str(FIXTURE), help="saved HN page")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    html_content = Path(args.page).read_text()
+    results = {
+        backend: measure(html_content, backend, args.repeat)
+        for backend in available_parsers()
+    }
+
+    print(f"{'parser':<12} {'items':>6} {'ms/page':>9} {'items/sec':>10} {'peak':>10}")
+    for backend, result in results.items():
+        print(
+            f"{backend:<12} {len(result['items']):>6} {result['ms_per_page']:>9.2f} "
+            f"{result['items_per_sec']:>10.0f} {result['peak_kib']:>6.0f} KiB"
+        )
+
+    reference = results["html.parser"]["items"]
+    for backend, result in results.items():
+        if result["items"] != reference:
+            raise SystemExit(f"{backend} extracted different stories than html.parser")
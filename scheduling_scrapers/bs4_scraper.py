@@ -1,9 +1,10 @@
-import json
+import importlib.util
+import os
 import requests
 
 from bs4 import BeautifulSoup
 from pydantic import BaseModel
-from datetime import datetime
+from news_store import get_store
 
 
 class NewsItem(BaseModel):
@@ -16,82 +17,129 @@ class NewsItem(BaseModel):
 
 
 BASE_URL = "https://news.ycombinator.com/"
+REQUEST_TIMEOUT = 30
 
+# Parser backends, fastest first. html.parser comes with Python, lxml and
+# selectolax are used when installed.
+PARSERS = ["selectolax", "lxml", "html.parser"]
 
-def get_page_content():
+
+def available_parsers():
+    return [
+        parser
+        for parser in PARSERS
+        if parser == "html.parser" or importlib.util.find_spec(parser) is not None
+    ]
+
+
+# The backend used unless one is passed, by default the fastest installed one
+PARSER = os.getenv("HN_PARSER") or available_parsers()[0]
+
+
+def get_page_content(url=BASE_URL):
     """
-    Send a GET request to the Hacker News homepage and return the HTML content.
+    Send a GET request to a Hacker News page and return the HTML content.
     """
-    response = requests.get(BASE_URL)
+    response = requests.get(url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
     return response.text
 
 
-def get_title_rows(html_content, class_name):
+def news_item(title, url, rank, author_href, score, age):
+    """A NewsItem from the text and attributes of one story's elements"""
+    return NewsItem(
+        title=title,
+        source_url=url,
+        # Job postings have no author or score
+        author=BASE_URL + author_href if author_href else "",
+        rank=rank,
+        upvotes=score or "",
+        date=age.split(" ")[0] if age else "",
+    )
+
+
+def _soup_items(html_content, parser):
     """
-    Parse the HTML content and return the first table row.
+    Stories in one pass over the table rows: each title row is followed by
+    the row holding its subtext
     """
-    soup = BeautifulSoup(html_content, "html.parser")
-    title_rows = soup.find("table").find_all("tr", {"class": class_name})
-    return title_rows
+    soup = BeautifulSoup(html_content, parser)
+    title_row = None
+    for row in soup.find_all("tr"):
+        if "athing" in (row.get("class") or []):
+            title_row = row
+            continue
+        subtext = title_row and row.find("td", class_="subtext", recursive=False)
+        if not subtext:
+            continue
+
+        link = title_row.find("span", class_="titleline").a
+        author = subtext.find("a", class_="hnuser")
+        score = subtext.find("span", class_="score")
+        age = subtext.find("span", class_="age")
+        yield news_item(
+            link.text,
+            link["href"],
+            title_row.find("span", class_="rank").text,
+            author and author["href"],
+            score and score.text,
+            age and age.get("title"),
+        )
+        title_row = None
+
+
+def _selectolax_items(html_content):
+    """Like _soup_items, with selectolax's lexbor engine matching both rows"""
+    from selectolax.lexbor import LexborHTMLParser
+
+    title_row = None
+    for node in LexborHTMLParser(html_content).css("tr.athing, td.subtext"):
+        if node.tag == "tr":
+            title_row = node
+            continue
+        if title_row is None:
+            continue
+
+        link = title_row.css_first("span.titleline > a")
+        author = node.css_first("a.hnuser")
+        score = node.css_first("span.score")
+        age = node.css_first("span.age")
+        yield news_item(
+            link.text(),
+            link.attributes["href"],
+            title_row.css_first("span.rank").text(),
+            author and author.attributes["href"],
+            score and score.text(),
+            age and age.attributes.get("title"),
+        )
+        title_row = None
 
 
-def get_subtext_rows(html_content):
+def parse_news_data(html_content, parser=PARSER):
     """
-    Parse the HTML content and return the subtext row.
+    Parse the stories of a Hacker News page with one of PARSERS.
     """
-    soup = BeautifulSoup(html_content, "html.parser")
-    subtext_rows = soup.find("table").find_all("td", {"class": "subtext"})
-    return subtext_rows
+    if parser == "selectolax":
+        return list(_selectolax_items(html_content))
+    if parser not in PARSERS:
+        raise ValueError(f"Unknown parser {parser!r}, expected one of {PARSERS}")
+    return list(_soup_items(html_content, parser))
 
 
-def get_news_data():
+def get_news_data(parser=PARSER):
     """
-    Extract the news data from the table row.
+    Fetch the Hacker News homepage once and extract its stories.
     """
-    title_rows = get_title_rows(get_page_content(), "athing submission")
-    subtext_rows = get_subtext_rows(get_page_content())
-
-    news_data = []
-
-    for title_row, subtext_row in zip(title_rows, subtext_rows):
-        # Extract title information from the title row
-        title_span = title_row.find("span", {"class": "titleline"})
-        title = title_span.a.text
-        url = title_span.a["href"]
-        rank = title_row.find("span", {"class": "rank"}).text
-
-        # Extract metadata from the subtext row
-        author = BASE_URL + subtext_row.find("a", {"class": "hnuser"})["href"]
-        upvotes = subtext_row.find("span", {"class": "score"}).text
-        date = subtext_row.find("span", {"class": "age"}).get("title").split(" ")[0]
-
-        news_data.append(
-            NewsItem(
-                title=title,
-                source_url=url,
-                author=author,
-                rank=rank,
-                upvotes=upvotes,
-                date=date,
-            )
-        )
-
-    return news_data
+    return parse_news_data(get_page_content(), parser)
 
 
 def save_news_data():
     """
-    Save the scraped news data to a JSON file with the current date in the filename.
+    Append the scraped news data to the news store as a new snapshot and
+    return the snapshot's file.
     """
-
     news_data = get_news_data()
-    current_date = datetime.now().strftime("%Y_%m_%d_%H_%M")
-    filename = f"hacker_news_data_{current_date}.json"
-
-    with open(filename, "w") as f:
-        json.dump([item.dict() for item in news_data], f, indent=4)
-
-    return filename
+    return get_store().append("bs4", (item.model_dump() for item in news_data))
 
 
 if __name__ == "__main__":
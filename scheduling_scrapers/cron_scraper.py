@@ -4,6 +4,7 @@ import logging
 from datetime import datetime
 from pathlib import Path
 from firecrawl_scraper import save_firecrawl_news_data
+from hn_crawler import run_crawl
 
 # Set up logging
 log_dir = Path("logs")
@@ -25,6 +26,13 @@ def main():
     except Exception as e:
         logging.error(f"Scraping failed: {str(e)}", exc_info=True)
 
+    try:
+        logging.info("Starting crawl of the top pages, newest and ask")
+        filename = run_crawl()
+        logging.info(f"Successfully saved crawl to {filename}")
+    except Exception as e:
+        logging.error(f"Crawl failed: {str(e)}", exc_info=True)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,138 @@
+"""
+A local stand-in for Hacker News, so the crawler can be exercised without
+network access and without being rate limited.
+
+Every page (`/`, `/news?p=N`, `/newest`, `/ask`) is rendered from the saved
+front page in fixtures/hn_front_page.html, with ranks and item ids shifted so
+each page has its own stories. Every response takes `--latency` seconds.
+
+    python fake_hn.py --port 8000 --latency 0.3
+    HN_BASE_URL=http://127.0.0.1:8000/ python hn_crawler.py --pages 10
+"""
+
+import argparse
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURE = Path(__file__).resolve().parent / "fixtures" / "hn_front_page.html"
+
+# Stories per page, and the first item id of the fixture page
+PAGE_SIZE = 30
+ITEM_IDS = re.compile(r"\b4233\d{4}\b")
+RANKS = re.compile(r'class="rank">(\d+)\.')
+
+# Sections served next to the numbered front pages, by their offset in ids
+SECTIONS = {"newest": 1, "ask": 2}
+
+
+class Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections of larger crawls, which
+    # clients only retry after a second
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def render_page(template: str, page: int, section: str = "news") -> str:
+    """The fixture page as page `page` of a section"""
+    offset = (SECTIONS.get(section, 0) * 1000 + page - 1) * PAGE_SIZE
+    rank_offset = (page - 1) * PAGE_SIZE
+    html = ITEM_IDS.sub(lambda match: str(int(match.group()) + offset), template)
+    html = RANKS.sub(
+        lambda match: f'class="rank">{int(match.group(1)) + rank_offset}.', html
+    )
+    return html.replace("href='?p=2'", f"href='?p={page + 1}'")
+
+
+class FakeHackerNews:
+    """
+    Fake Hacker News server running in a background thread.
+
+    Args:
+        port (int): Port to listen on, 0 picks a free one
+        latency (float): Seconds every page takes
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.0):
+        self.latency = latency
+        self.template = FIXTURE.read_text()
+        self.requests = 0
+        # TCP connections opened by clients, and most requests served at once
+        self.connections = 0
+        self.max_concurrent = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self.server = Server(("127.0.0.1", port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _make_handler(fake):
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive, like the real site
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                section = parts.path.strip("/") or "news"
+                if section != "news" and section not in SECTIONS:
+                    self.send_error(404)
+                    return
+                page = int(parse_qs(parts.query).get("p", ["1"])[0])
+
+                with fake._lock:
+                    fake.requests += 1
+                    fake._active += 1
+                    fake.max_concurrent = max(fake.max_concurrent, fake._active)
+                time.sleep(fake.latency)
+                with fake._lock:
+                    fake._active -= 1
+
+                body = render_page(fake.template, page, section).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Hacker News server")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeHackerNews(args.port, args.latency)
+    print(f"Fake Hacker News listening on {fake.url}")
+    fake.server.serve_forever()
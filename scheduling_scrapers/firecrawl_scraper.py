@@ -1,13 +1,18 @@
 # firecrawl_scraper.py
-import json
-from firecrawl import FirecrawlApp
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from typing import List
-from datetime import datetime
+from news_store import get_store
 
 load_dotenv()
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared"))
+from firecrawl_client import get_client
+
+# Not behind the fetch gate: ages, points and comment counts on the front
+# page change every minute, so its content never hashes the same twice
 BASE_URL = "https://news.ycombinator.com/"
 
 
@@ -15,7 +20,9 @@ class NewsItem(BaseModel):
     title: str = Field(description="The title of the news item")
     source_url: str = Field(description="The URL of the news item")
     author: str = Field(
-        description="The URL of the post author's profile concatenated with the base URL."
+        description=(
+            "The URL of the post author's profile concatenated with the base URL."
+        )
     )
     rank: str = Field(description="The rank of the news item")
     upvotes: str = Field(description="The number of upvotes of the news item")
@@ -27,7 +34,7 @@ class NewsData(BaseModel):
 
 
 def get_firecrawl_news_data():
-    app = FirecrawlApp()
+    app = get_client()
 
     data = app.scrape_url(
         BASE_URL,
@@ -42,20 +49,14 @@ def get_firecrawl_news_data():
 
 def save_firecrawl_news_data():
     """
-    Save the scraped news data to a JSON file with the current date in the filename.
+    Append the scraped news data to the news store as a new snapshot and
+    return the snapshot's file.
     """
     # Get the data
     data = get_firecrawl_news_data()
-    # Format current date for filename
-    date_str = datetime.now().strftime("%Y_%m_%d_%H_%M")
-    filename = f"firecrawl_hacker_news_data_{date_str}.json"
-
-    # Save the news items to JSON file
-    with open(filename, "w") as f:
-        json.dump(data["extract"]["news_items"], f, indent=4)
-
-    return filename
+    return get_store().append("firecrawl", data["extract"]["news_items"])
 
 
 if __name__ == "__main__":
     save_firecrawl_news_data()
+    print(get_client().stats)
@@ -0,0 +1,121 @@
+"""
+Crawl the top Hacker News pages, `newest` and `ask` concurrently.
+
+All pages are fetched over one aiohttp session whose connection pool both
+keeps connections alive and bounds the number of requests in flight. Each
+page is parsed (with bs4_scraper's parser backends) as soon as it arrives and
+its stories are yielded right away, so a crawl of N pages takes about as long
+as its slowest page rather than N pages one after another.
+
+    python hn_crawler.py
+    python hn_crawler.py --pages 5 --concurrency 8
+
+HN_BASE_URL points the crawler at another server, such as fake_hn.py.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import aiohttp
+
+from bs4_scraper import PARSER, parse_news_data
+from news_store import get_store
+
+BASE_URL = os.getenv("HN_BASE_URL", "https://news.ycombinator.com/")
+# Front pages crawled per run (news, news?p=2, ...)
+PAGES = int(os.getenv("HN_PAGES", "3"))
+# Requests in flight at the same time, and connections kept alive
+CONCURRENCY = int(os.getenv("HN_CONCURRENCY", "4"))
+# Crawled after the front pages
+SECTIONS = ["newest", "ask"]
+MAX_RETRIES = 3
+REQUEST_TIMEOUT = 30
+
+# Hacker News answers 503 when requests come in too quickly
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+def crawl_urls(pages: int = PAGES, base_url: str = BASE_URL) -> list:
+    """The URLs of the first `pages` front pages and of SECTIONS"""
+    urls = [base_url] + [f"{base_url}news?p={page}" for page in range(2, pages + 1)]
+    return urls + [f"{base_url}{section}" for section in SECTIONS]
+
+
+async def fetch(session: aiohttp.ClientSession, url: str) -> str:
+    for attempt in range(MAX_RETRIES + 1):
+        async with session.get(url) as response:
+            if response.status not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                response.raise_for_status()
+                return await response.text()
+        # Jittered exponential backoff
+        await asyncio.sleep(random.uniform(0, 2**attempt))
+
+
+async def crawl_page(session: aiohttp.ClientSession, url: str, parser: str):
+    """Fetch and parse one page, returning (url, items, error)"""
+    try:
+        html_content = await fetch(session, url)
+        # Parsing runs in a thread so the other responses keep streaming in
+        items = await asyncio.to_thread(parse_news_data, html_content, parser)
+        return url, items, None
+    except Exception as e:
+        return url, [], e
+
+
+async def crawl_pages(urls, concurrency: int = CONCURRENCY, parser: str = PARSER):
+    """
+    Yield (url, items, error) for every page in the order the pages finish.
+    A failed page does not stop the crawl.
+    """
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        tasks = [asyncio.create_task(crawl_page(session, url, parser)) for url in urls]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # The caller stopped early
+            for task in tasks:
+                task.cancel()
+
+
+async def save_crawl(pages: int = PAGES, concurrency: int = CONCURRENCY):
+    """
+    Crawl the pages and append their stories, with the URL of their page, to
+    the news store as one snapshot. Returns the snapshot's file.
+    """
+    start = time.perf_counter()
+    rows, crawled, failed = [], 0, 0
+    async for url, items, error in crawl_pages(crawl_urls(pages), concurrency):
+        if error is not None:
+            failed += 1
+            print(f"Error crawling {url}: {error}")
+            continue
+        crawled += 1
+        rows.extend({"page": url, **item.model_dump()} for item in items)
+        print(f"{url}: {len(items)} stories after {time.perf_counter() - start:.2f}s")
+
+    path = get_store().append("crawl", rows)
+    print(
+        f"Crawled {crawled} pages ({failed} failed, {len(rows)} stories) in "
+        f"{time.perf_counter() - start:.2f}s"
+    )
+    return path
+
+
+def run_crawl():
+    """Crawl and save the pages from synchronous code, like the schedulers"""
+    return asyncio.run(save_crawl())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl several Hacker News pages")
+    parser.add_argument("--pages", type=int, default=PAGES, help="front pages")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    args = parser.parse_args()
+
+    asyncio.run(save_crawl(args.pages, args.concurrency))
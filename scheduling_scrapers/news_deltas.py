@@ -0,0 +1,366 @@
+"""
+Delta-encoded store of scraped news snapshots.
+
+Consecutive snapshots of a page share almost all of their stories, so only
+every KEYFRAME_INTERVAL-th snapshot is stored in full (a keyframe). The ones
+in between only store the stories added or removed and the fields that
+changed, keyed by a stable story id (its URL). A keyframe and its deltas form
+one JSON Lines segment per source:
+
+    data/deltas/source=bs4/segment-20241201T090000-3f2a9c1e.jsonl
+
+Every snapshot starts with a header line and is followed by one line per
+story, which starts with the story's key:
+
+    {"snapshot_id": "...", "scraped_at": "...", "keyframe": false, "changes": 2}
+    {"key": "https://example.com/a", "pos": 3, "set": {"rank": "4.", "upvotes": "51"}}
+    {"key": "https://example.com/b", "removed": true}
+
+A write appends one snapshot's lines to the open segment. The state after
+the last snapshot is kept in a small `.state.json` next to the segments, so
+writing a delta never rereads the segment. Rebuilding the snapshot at a time
+only reads the one segment holding it, and the trajectory of one story skips
+the lines of all other stories without decoding them:
+
+    python news_deltas.py encode --source bs4
+    python news_deltas.py snapshot --source bs4 --at 2024-12-01T12:00
+    python news_deltas.py trajectory --source bs4 --key https://example.com/a
+    python news_deltas.py stats
+
+NEWS_KEYFRAME_INTERVAL sets the snapshots per keyframe (default: 24).
+"""
+
+import argparse
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+from itertools import groupby
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from news_store import DATA_DIR, NewsStore
+
+DELTA_DIR = DATA_DIR / "deltas"
+# Snapshots per segment: a keyframe followed by this many minus one deltas
+KEYFRAME_INTERVAL = int(os.getenv("NEWS_KEYFRAME_INTERVAL", "24"))
+# Fields identifying a story across snapshots, the first one set is used
+KEY_FIELDS = ["source_url", "title"]
+METADATA_FIELDS = {"snapshot_id", "scraped_at"}
+
+
+def item_keys(items: list) -> list:
+    """
+    Stable keys of the items of one snapshot. Items sharing a URL (the same
+    story on two crawled pages) get a running suffix.
+    """
+    keys, counts = [], {}
+    for item in items:
+        key = next((item[field] for field in KEY_FIELDS if item.get(field)), "")
+        counts[key] = counts.get(key, 0) + 1
+        keys.append(key if counts[key] == 1 else f"{key}#{counts[key]}")
+    return keys
+
+
+def _utc(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def _key_prefix(key: str) -> str:
+    return '{"key": ' + json.dumps(key) + ","
+
+
+class DeltaStore:
+    """
+    Keyframe and delta segments of news snapshots, written with the same
+    `append` as NewsStore.
+
+    Args:
+        root (Path): Directory of the store, created on the first write
+        keyframe_interval (int): Snapshots per segment
+    """
+
+    def __init__(self, root: Path = DELTA_DIR, keyframe_interval=KEYFRAME_INTERVAL):
+        self.root = Path(root)
+        self.keyframe_interval = keyframe_interval
+        # The last segment of every source written to, see `_last`
+        self._last_segments = {}
+
+    def segments(self, source: str) -> list:
+        """Segment files of a source, oldest first"""
+        return sorted((self.root / f"source={source}").glob("segment-*.jsonl"))
+
+    @staticmethod
+    def _snapshots(path: Path, key: Optional[str] = None) -> Iterator[tuple]:
+        """
+        (header, story lines, end offset) of every complete snapshot of a
+        segment, only with the lines of one story if `key` is given
+        """
+        prefix = _key_prefix(key) if key is not None else '{"key": '
+        header, records, lines, end = None, [], 0, 0
+        with open(path, "rb") as f:
+            for raw_line in f:
+                # A write cut off by a crash leaves an incomplete last line
+                if not raw_line.endswith(b"\n"):
+                    break
+                line = raw_line.decode("utf-8")
+                if line.startswith('{"snapshot_id"'):
+                    if header is not None and lines == header["changes"]:
+                        yield header, records, end
+                    header, records, lines = json.loads(line), [], 0
+                else:
+                    lines += 1
+                    if line.startswith(prefix):
+                        records.append(json.loads(line))
+                end += len(raw_line)
+        if header is not None and lines == header["changes"]:
+            yield header, records, end
+
+    def _states(self, path: Path) -> Iterator[tuple]:
+        """(header, state, end offset) after every snapshot of a segment"""
+        state = {}
+        for header, records, end in self._snapshots(path):
+            for record in records:
+                if record.get("removed"):
+                    del state[record["key"]]
+                else:
+                    pos, fields = state.get(record["key"], (None, {}))
+                    state[record["key"]] = (record["pos"], {**fields, **record["set"]})
+            yield header, state, end
+
+    def _state_path(self, source: str) -> Path:
+        return self.root / f"source={source}" / ".state.json"
+
+    def _save_last(self, source: str, last: dict):
+        self._last_segments[source] = last
+        path = self._state_path(source)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(json.dumps(last))
+        tmp_path.replace(path)
+
+    def _last(self, source: str) -> tuple:
+        """
+        The last segment of a source, its snapshot count, last state and the
+        size of its complete snapshots. They are kept in memory and in the
+        state file, and only rebuilt from the segment when another process
+        wrote to it or a write was interrupted.
+        """
+        segments = self.segments(source)
+        if not segments:
+            return None, 0, {}, 0
+        path = segments[-1]
+        size = path.stat().st_size
+        last = self._last_segments.get(source)
+        if last is None and self._state_path(source).exists():
+            last = json.loads(self._state_path(source).read_text())
+        if last is not None and (last["segment"], last["size"]) == (path.name, size):
+            state = {key: tuple(value) for key, value in last["state"].items()}
+            return path, last["snapshots"], state, size
+
+        snapshots, state, size = 0, {}, 0
+        for _, state, size in self._states(path):
+            snapshots += 1
+        return path, snapshots, state, size
+
+    def append(
+        self,
+        source: str,
+        items: Iterable[dict],
+        scraped_at: Optional[datetime] = None,
+    ) -> Path:
+        """
+        Append the items of one run as a delta against the previous snapshot,
+        or as a keyframe starting a new segment, returning the segment file.
+        Readers skip a snapshot with fewer lines than its header announces,
+        so they never see half a snapshot, and the next write drops it.
+        """
+        scraped_at = _utc(scraped_at or datetime.now(timezone.utc))
+        snapshot_id = f"{scraped_at:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        items = [
+            {k: v for k, v in item.items() if k not in METADATA_FIELDS}
+            for item in items
+        ]
+        new_state = {
+            key: (pos, item)
+            for pos, (key, item) in enumerate(zip(item_keys(items), items))
+        }
+
+        path, snapshots, state, size = self._last(source)
+        keyframe = path is None or snapshots >= self.keyframe_interval
+        if keyframe:
+            state, snapshots, size = {}, 0, 0
+        lines = []
+        for key, (pos, item) in new_state.items():
+            old_pos, old_item = state.get(key, (None, {}))
+            changed = {k: v for k, v in item.items() if old_item.get(k) != v}
+            if changed or pos != old_pos:
+                lines.append({"key": key, "pos": pos, "set": changed})
+            # The state readers rebuild keeps fields a story no longer has
+            new_state[key] = (pos, {**old_item, **item})
+        lines.extend(
+            {"key": key, "removed": True} for key in state.keys() - new_state.keys()
+        )
+
+        header = {
+            "snapshot_id": snapshot_id,
+            "scraped_at": scraped_at.isoformat(),
+            "keyframe": keyframe,
+            "changes": len(lines),
+        }
+        if keyframe:
+            path = self.root / f"source={source}" / f"segment-{snapshot_id}.jsonl"
+            path.parent.mkdir(parents=True, exist_ok=True)
+        data = "".join(json.dumps(record) + "\n" for record in [header] + lines)
+        data = data.encode("utf-8")
+        with open(path, "ab") as f:
+            # Drop what an interrupted write left after the last snapshot
+            f.truncate(size)
+            f.write(data)
+        self._save_last(
+            source,
+            {
+                "segment": path.name,
+                "snapshots": snapshots + 1,
+                "size": size + len(data),
+                "state": new_state,
+            },
+        )
+        return path
+
+    def snapshot_at(
+        self, source: str, at: Optional[datetime] = None
+    ) -> Optional[tuple]:
+        """
+        The last snapshot taken at or before `at` (the latest by default), as
+        (header, items in their scraped order), or None before the first one.
+        """
+        at = _utc(at or datetime.now(timezone.utc))
+        # Segments are named after their first snapshot, so the one holding
+        # the snapshot is the last one starting at or before `at`
+        segments = [
+            path
+            for path in self.segments(source)
+            if path.stem.split("-", 1)[1][:15] <= f"{at:%Y%m%dT%H%M%S}"
+        ]
+        for path in reversed(segments):
+            found = None
+            for header, state, _ in self._states(path):
+                if datetime.fromisoformat(header["scraped_at"]) > at:
+                    break
+                found = header, [item for _, item in sorted(state.values())]
+            if found:
+                return found
+        return None
+
+    def trajectory(self, source: str, key: str, field: str = "rank") -> Iterator[tuple]:
+        """
+        Yield (scraped_at, value) every time one story's field changed, with
+        None while the story was not in the snapshots. Only the snapshot
+        headers and the lines of that story are decoded.
+        """
+        value = reported = None
+        for path in self.segments(source):
+            for header, records, _ in self._snapshots(path, key):
+                # A keyframe holds every story, so one missing from it is gone
+                if header["keyframe"]:
+                    value = None
+                for record in records:
+                    if record.get("removed"):
+                        value = None
+                    else:
+                        value = record["set"].get(field, value)
+                if value != reported:
+                    reported = value
+                    yield datetime.fromisoformat(header["scraped_at"]), value
+
+    def stats(self) -> dict:
+        """Segments, snapshots, story lines and bytes per source"""
+        stats = {}
+        for source_dir in sorted(self.root.glob("source=*")):
+            source = source_dir.name.split("=", 1)[1]
+            entry = {"segments": 0, "snapshots": 0, "lines": 0, "bytes": 0}
+            for path in self.segments(source):
+                entry["segments"] += 1
+                entry["bytes"] += path.stat().st_size
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.startswith('{"snapshot_id"'):
+                            entry["snapshots"] += 1
+                        else:
+                            entry["lines"] += 1
+            stats[source] = entry
+        return stats
+
+
+def encode(store: NewsStore, deltas: DeltaStore, source: str) -> int:
+    """Append every snapshot of a source in `store` to `deltas`"""
+    snapshots = 0
+    rows = store.scan(source)
+    for snapshot_id, snapshot in groupby(rows, key=lambda row: row["snapshot_id"]):
+        snapshot = list(snapshot)
+        scraped_at = datetime.fromisoformat(snapshot[0]["scraped_at"])
+        deltas.append(source, snapshot, scraped_at)
+        snapshots += 1
+    return snapshots
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delta-encoded news snapshots")
+    parser.add_argument("--root", default=str(DELTA_DIR), help="store directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    encode_parser = commands.add_parser(
+        "encode", help="append the history of the snapshot store"
+    )
+    encode_parser.add_argument("--source", required=True)
+
+    snapshot_parser = commands.add_parser(
+        "snapshot", help="print the stories scraped at a time as JSON"
+    )
+    snapshot_parser.add_argument("--source", required=True)
+    snapshot_parser.add_argument(
+        "--at", type=datetime.fromisoformat, help="UTC time (default: now)"
+    )
+
+    trajectory_parser = commands.add_parser(
+        "trajectory", help="print every change of one story's field"
+    )
+    trajectory_parser.add_argument("--source", required=True)
+    trajectory_parser.add_argument("--key", required=True, help="story URL")
+    trajectory_parser.add_argument("--field", default="rank")
+
+    commands.add_parser("stats", help="segments and snapshots per source")
+    args = parser.parse_args()
+
+    deltas = DeltaStore(args.root)
+    if args.command == "encode":
+        store = NewsStore()
+        snapshots = encode(store, deltas, args.source)
+        full = sum(
+            path.stat().st_size
+            for partition in store.partitions(args.source)
+            for path in store.files(partition)
+        )
+        encoded = sum(path.stat().st_size for path in deltas.segments(args.source))
+        print(
+            f"Encoded {snapshots} snapshots: {encoded / 1024:.0f} KiB of deltas "
+            f"for {full / 1024:.0f} KiB of compressed snapshots"
+        )
+    elif args.command == "snapshot":
+        found = deltas.snapshot_at(args.source, args.at)
+        if found is None:
+            parser.exit(1, "No snapshot at that time\n")
+        header, items = found
+        print(json.dumps({**header, "items": items}, indent=4))
+    elif args.command == "trajectory":
+        for scraped_at, value in deltas.trajectory(args.source, args.key, args.field):
+            print(f"{scraped_at:%Y-%m-%d %H:%M:%S}  {value}")
+    else:
+        for source, entry in deltas.stats().items():
+            print(
+                f"{source}: {entry['snapshots']} snapshots in "
+                f"{entry['segments']} segments, {entry['lines']} story lines "
+                f"({entry['bytes'] / 1024:.0f} KiB)"
+            )
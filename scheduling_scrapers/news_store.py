@@ -0,0 +1,255 @@
+"""
+Append-only store of scraped news snapshots.
+
+Every run of a scraper appends its items as one gzip-compressed JSON Lines
+file to a partition per source and UTC day:
+
+    data/source=firecrawl/date=2024-12-01/part-T093000-3f2a9c1e.jsonl.gz
+
+Every row is one item plus the `snapshot_id` and `scraped_at` of its run, so
+a write only costs the items of that run and never touches earlier files.
+`compact` rolls the day partitions of finished days up into one file per
+month, so scanning a month of history opens one file plus the open day's.
+Each day is appended to the month file as its own gzip member, and the days
+already in it are listed in `.compacted.json`:
+
+    data/source=firecrawl/date=2024-12/compacted.jsonl.gz
+
+    python news_store.py compact
+    python news_store.py scan --source firecrawl --since 2024-12-01
+    python news_store.py stats
+
+NEWS_DATA_DIR sets the root directory of the store. With NEWS_STORE=deltas
+the scrapers write delta-encoded snapshots instead (see news_deltas.py).
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+DATA_DIR = Path(os.getenv("NEWS_DATA_DIR", Path(__file__).resolve().parent / "data"))
+COMPACTED_NAME = "compacted.jsonl.gz"
+# Days appended to a month file and the file's size after the last of them
+MANIFEST_NAME = ".compacted.json"
+# "snapshots" stores every run in full, "deltas" only its changes
+STORE_FORMAT = os.getenv("NEWS_STORE", "snapshots")
+
+
+def _partition_range(partition: Path) -> tuple:
+    """First and last day of a day (date=YYYY-MM-DD) or month (date=YYYY-MM)"""
+    value = partition.name.split("=", 1)[1]
+    if len(value) == len("YYYY-MM-DD"):
+        day = date.fromisoformat(value)
+        return day, day
+    first = date.fromisoformat(f"{value}-01")
+    next_month = (first + timedelta(days=31)).replace(day=1)
+    return first, next_month - timedelta(days=1)
+
+
+def _is_month(partition: Path) -> bool:
+    return len(partition.name) == len("date=YYYY-MM")
+
+
+class NewsStore:
+    """
+    Date-partitioned gzip JSON Lines dataset of news snapshots.
+
+    Args:
+        root (Path): Directory of the store, created on the first write
+    """
+
+    def __init__(self, root: Path = DATA_DIR):
+        self.root = Path(root)
+
+    def append(
+        self,
+        source: str,
+        items: Iterable[dict],
+        scraped_at: Optional[datetime] = None,
+    ) -> Path:
+        """
+        Write the items of one run as a new snapshot, returning its file.
+        The file is written under a temporary name and renamed once complete,
+        so readers never see half a snapshot.
+        """
+        scraped_at = scraped_at or datetime.now(timezone.utc)
+        snapshot_id = f"{scraped_at:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        partition = self.root / f"source={source}" / f"date={scraped_at:%Y-%m-%d}"
+        partition.mkdir(parents=True, exist_ok=True)
+
+        path = partition / f"part-{snapshot_id[8:]}.jsonl.gz"
+        metadata = {"snapshot_id": snapshot_id, "scraped_at": scraped_at.isoformat()}
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps({**metadata, **item}) + "\n")
+        tmp_path.rename(path)
+        return path
+
+    def partitions(
+        self,
+        source: Optional[str] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+    ) -> list:
+        """
+        Month and day partition directories of a source (or all) overlapping
+        a date range. A month sorts before the days appended after it.
+        """
+        partitions = []
+        for partition in self.root.glob(f"source={source or '*'}/date=*"):
+            first, last = _partition_range(partition)
+            if (since is None or last >= since) and (until is None or first <= until):
+                partitions.append(partition)
+        return sorted(partitions)
+
+    @staticmethod
+    def files(partition: Path) -> list:
+        """Data files of a partition, oldest first"""
+        # "compacted" sorts before the "part-" files written after it
+        return sorted(partition.glob("*.jsonl.gz"))
+
+    def scan(
+        self,
+        source: Optional[str] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+    ) -> Iterator[dict]:
+        """Rows of all snapshots within a date range, oldest first per source"""
+        for partition in self.partitions(source, since, until):
+            first, last = _partition_range(partition)
+            # A month can hold days outside the range
+            partial = (since is not None and first < since) or (
+                until is not None and last > until
+            )
+            for path in self.files(partition):
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        row = json.loads(line)
+                        if partial:
+                            day = date.fromisoformat(row["scraped_at"][:10])
+                            if (since and day < since) or (until and day > until):
+                                continue
+                        yield row
+
+    def compact(
+        self, source: Optional[str] = None, before: Optional[date] = None
+    ) -> tuple:
+        """
+        Roll every day partition older than `before` (today by default) up
+        into the compacted file of its month, appending only the days not in
+        it yet. Returns the number of months written and of day partitions
+        merged into them.
+        """
+        before = before or datetime.now(timezone.utc).date()
+        months = {}
+        for partition in self.partitions(source, until=before - timedelta(days=1)):
+            if not _is_month(partition):
+                month = partition.with_name(partition.name[: len("date=YYYY-MM")])
+                months.setdefault(month, []).append(partition)
+
+        merged = 0
+        for month, days in months.items():
+            month.mkdir(exist_ok=True)
+            target = month / COMPACTED_NAME
+            manifest_path = month / MANIFEST_NAME
+            if manifest_path.exists():
+                manifest = json.loads(manifest_path.read_text())
+            else:
+                # Month files written before the manifest hold no open days
+                size = target.stat().st_size if target.exists() else 0
+                manifest = {"days": [], "size": size}
+
+            with open(target, "ab") as f:
+                # Drop a day an interrupted compaction appended but never
+                # recorded, it is appended again below
+                f.truncate(manifest["size"])
+                for day in days:
+                    if day.name in manifest["days"]:
+                        continue
+                    with gzip.GzipFile(fileobj=f, mode="wb") as out:
+                        for path in self.files(day):
+                            with gzip.open(path, "rb") as day_file:
+                                out.writelines(day_file)
+                    manifest["days"].append(day.name)
+            manifest["size"] = target.stat().st_size
+
+            tmp_path = month / f".{MANIFEST_NAME}.tmp"
+            tmp_path.write_text(json.dumps(manifest))
+            tmp_path.replace(manifest_path)
+            # The days merged into the month are only removed once recorded
+            for day in days:
+                for path in day.iterdir():
+                    path.unlink()
+                day.rmdir()
+            merged += len(days)
+        return len(months), merged
+
+    def stats(self) -> dict:
+        """Files, rows and compressed bytes per source"""
+        stats = {}
+        for partition in self.partitions():
+            source = partition.parent.name.split("=", 1)[1]
+            entry = stats.setdefault(
+                source, {"partitions": 0, "files": 0, "rows": 0, "bytes": 0}
+            )
+            entry["partitions"] += 1
+            for path in self.files(partition):
+                entry["files"] += 1
+                entry["bytes"] += path.stat().st_size
+                with gzip.open(path, "rb") as f:
+                    entry["rows"] += sum(1 for _ in f)
+        return stats
+
+
+def get_store():
+    """The store the scrapers append their runs to, chosen by NEWS_STORE"""
+    if STORE_FORMAT == "deltas":
+        from news_deltas import DeltaStore
+
+        return DeltaStore()
+    return NewsStore()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the news snapshot store")
+    parser.add_argument("--root", default=str(DATA_DIR), help="store directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compact_parser = commands.add_parser(
+        "compact", help="roll finished days up into one file per month"
+    )
+    compact_parser.add_argument("--source")
+    compact_parser.add_argument(
+        "--before",
+        type=date.fromisoformat,
+        help="only compact days before this date (default: today)",
+    )
+
+    scan_parser = commands.add_parser("scan", help="print rows as JSON Lines")
+    scan_parser.add_argument("--source")
+    scan_parser.add_argument("--since", type=date.fromisoformat)
+    scan_parser.add_argument("--until", type=date.fromisoformat)
+
+    commands.add_parser("stats", help="files and rows per source")
+    args = parser.parse_args()
+
+    store = NewsStore(args.root)
+    if args.command == "compact":
+        months, days = store.compact(args.source, args.before)
+        print(f"Merged {days} days into {months} monthly files")
+    elif args.command == "scan":
+        for row in store.scan(args.source, args.since, args.until):
+            sys.stdout.write(json.dumps(row) + "\n")
+    else:
+        for source, entry in store.stats().items():
+            print(
+                f"{source}: {entry['rows']} rows in {entry['files']} files "
+                f"({entry['partitions']} partitions, {entry['bytes'] / 1024:.0f} KiB)"
+            )
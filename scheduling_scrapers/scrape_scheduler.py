@@ -1,9 +1,11 @@
 import schedule
 import time
 from firecrawl_scraper import save_firecrawl_news_data
+from hn_crawler import run_crawl
 
-# Schedule the scraper to run every hour
+# Schedule the scraper and the crawl of the top pages to run every hour
 schedule.every().hour.do(save_firecrawl_news_data)
+schedule.every().hour.do(run_crawl)
 
 while True:
     schedule.run_pending()
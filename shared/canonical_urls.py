@@ -0,0 +1,129 @@
+"""
+Canonical product URLs.
+
+The same product page is often stored under several URLs: with tracking
+parameters, a different slug, or a shortened or regional path. `canonicalize`
+maps all of them to one URL, so each page is scraped once per run and the
+result is fanned out to every row that references it:
+
+    >>> canonicalize("https://www.amazon.com/Some-Slug/dp/B002U21ZZK/ref=sr_1_1?th=1")
+    'https://www.amazon.com/dp/B002U21ZZK'
+"""
+
+import re
+from typing import Dict, Iterable, List
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a visit came from, on every site.
+# Parameters like "ref" and "tag" pick a product or variant on some shops, so
+# they are only dropped by the rules of the sites that use them for tracking.
+TRACKING_PARAMS = {
+    "fbclid",
+    "gclid",
+    "dclid",
+    "msclkid",
+    "mc_cid",
+    "mc_eid",
+    "igshid",
+    "referrer",
+    "affid",
+}
+TRACKING_PREFIXES = ("utm_", "pf_rd_", "pd_rd_")
+
+AMAZON_ASIN = re.compile(
+    r"/(?:dp|gp/product|gp/aw/d|exec/obidos/asin|o/asin)/([A-Z0-9]{10})(?:[/?]|$)",
+    re.IGNORECASE,
+)
+BESTBUY_SKU = re.compile(r"^/site/(?:(.+)/)?(\d+)\.p$")
+WALMART_ITEM = re.compile(r"^/ip/(?:.+/)?(\d+)$")
+EBAY_ITEM = re.compile(r"^/itm/(?:.+/)?(\d+)$")
+# Referral and affiliate parameters of pages the site rules keep a query for
+AMAZON_TRACKING_PARAMS = {"ref", "ref_", "tag"}
+BESTBUY_TRACKING_PARAMS = {"ref", "loc"}
+
+
+def _registered_domain(host: str) -> str:
+    """The registered part of a host, e.g. amazon.co.uk for smile.amazon.co.uk"""
+    parts = host.split(".")
+    size = 3 if len(parts) >= 3 and parts[-2] in ("co", "com") else 2
+    return ".".join(parts[-size:])
+
+
+def _without(query, params):
+    return [(key, value) for key, value in query if key.lower() not in params]
+
+
+def _amazon(path, query):
+    match = AMAZON_ASIN.search(path)
+    if match:
+        return f"/dp/{match.group(1).upper()}", []
+    return path, _without(query, AMAZON_TRACKING_PARAMS)
+
+
+def _bestbuy(path, query):
+    # The slug before the SKU is optional and changes with the product title
+    match = BESTBUY_SKU.match(path)
+    if match:
+        sku = match.group(2)
+        return f"/site/{sku}.p", [("skuId", sku)]
+    return path, _without(query, BESTBUY_TRACKING_PARAMS)
+
+
+def _walmart(path, query):
+    match = WALMART_ITEM.match(path)
+    if match:
+        return f"/ip/{match.group(1)}", []
+    return path, query
+
+
+def _ebay(path, query):
+    match = EBAY_ITEM.match(path)
+    if match:
+        return f"/itm/{match.group(1)}", []
+    return path, query
+
+
+# Per-site rules by the site's name, applied after the generic clean-up. Pages
+# of these sites are also served from any subdomain, so it becomes www.
+SITE_RULES = {
+    "amazon": _amazon,
+    "bestbuy": _bestbuy,
+    "walmart": _walmart,
+    "ebay": _ebay,
+}
+
+
+def canonicalize(url: str) -> str:
+    """
+    The canonical form of a product URL: lowercase host without a default
+    port, no fragment, trailing slash or tracking parameters, a sorted query,
+    and the site's own rules applied
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "https").lower()
+    host = parts.hostname or ""
+    if parts.port and parts.port != {"http": 80, "https": 443}.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    path = re.sub(r"/{2,}", "/", parts.path).rstrip("/")
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS
+        and not key.lower().startswith(TRACKING_PREFIXES)
+    )
+
+    domain = _registered_domain(parts.hostname or "")
+    rule = SITE_RULES.get(domain.split(".")[0])
+    if rule is not None:
+        host = f"www.{domain}"
+        path, query = rule(path, query)
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def group_by_canonical(urls: Iterable[str]) -> Dict[str, List[str]]:
+    """The distinct URLs grouped by their canonical URL, in first-seen order"""
+    groups = {}
+    for url in dict.fromkeys(urls):
+        groups.setdefault(canonicalize(url), []).append(url)
+    return groups
@@ -0,0 +1,319 @@
+"""
+Skip Firecrawl extractions of pages that have not changed since the last run.
+
+Before a page is extracted, `FetchGate.check` fetches it directly (no
+Firecrawl credits), sending the ETag and Last-Modified validators of the
+previous fetch. When the server answers 304, or the page's normalized
+content hashes to the same value as last time, the previous extraction is
+reused instead of paying for a new one:
+
+    gate = get_gate(Path(__file__).parent / "fetch_gate.json")
+    data = gate.get(url, lambda: get_client().scrape_url(url, params=...))
+    gate.save()
+
+Scripts, styles, comments and per-request attributes like nonces are dropped
+before hashing, so only changes to the page's content count. Content a page
+renders in the browser is not in its raw HTML, so a result is reused for at
+most MAX_AGE_HOURS before the page is extracted again anyway. Pages the
+direct fetch fails on (error statuses, timeouts) are always extracted.
+
+Bot protection often answers with a challenge page and a 200 status, which
+hashes the same on every run. With `key_fields`, e.g. ("price",), a page
+with the same content is only reused if the values of those fields in its
+last extraction still appear in the fetched HTML:
+
+    data = gate.get(url, extract, key_fields=("price",))
+
+Validators and results are stored in a JSON file, and `gate.stats` counts
+the checks, the extractions skipped and the credits and seconds they saved.
+FETCH_GATE=off turns the gate off, so `get_gate` returns None and every page
+is extracted.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import cache
+from html import unescape
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import requests
+
+from firecrawl_client import EXTRACT_CREDITS
+
+# Extractions older than this are redone even if the page looks unchanged
+MAX_AGE_HOURS = float(os.getenv("FETCH_GATE_MAX_AGE_HOURS", "24"))
+# Direct fetches running at the same time in `check_many`
+CHECK_WORKERS = int(os.getenv("FETCH_GATE_WORKERS", "8"))
+REQUEST_TIMEOUT = 15
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0 Safari/537.36"
+)
+
+# Markup that changes on every request without changing the page's content.
+# JSON-LD scripts are kept, since they often hold the product data.
+VOLATILE_MARKUP = re.compile(
+    r"<script\b(?![^>]*application/ld\+json)[^>]*>.*?</script>"
+    r"|<style\b[^>]*>.*?</style>|<noscript\b[^>]*>.*?</noscript>|<!--.*?-->",
+    re.IGNORECASE | re.DOTALL,
+)
+VOLATILE_ATTRIBUTES = re.compile(
+    r"\s(?:nonce|integrity|[\w-]*csrf[\w-]*|data-request-id)"
+    r"""=(?:"[^"]*"|'[^']*')""",
+    re.IGNORECASE,
+)
+
+
+def normalize_html(html: str) -> str:
+    html = VOLATILE_MARKUP.sub("", html)
+    html = VOLATILE_ATTRIBUTES.sub("", html)
+    return " ".join(html.split())
+
+
+def content_hash(html: str) -> str:
+    return hashlib.sha256(normalize_html(html).encode()).hexdigest()
+
+
+def value_in_html(value: Any, html: str) -> bool:
+    """
+    Whether an extracted value appears in a page's HTML. Numbers match in
+    their usual formats, e.g. 1299.0 matches "1,299", "1299.00" or "1.299,00".
+    """
+    html = unescape(html)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return str(value) in html
+    whole, cents = f"{abs(value):.2f}".split(".")
+    # Groups of thousands with an optional separator between them
+    groups = [whole[max(0, end - 3) : end] for end in range(len(whole), 0, -3)]
+    digits = r"[,.\s]?".join(reversed(groups))
+    # The cents follow a decimal point or comma and may be left out of round
+    # amounts
+    cents = rf"[.,]{cents}" + ("" if cents != "00" else "|")
+    pattern = rf"(?<![\d.,]){digits}(?:{cents})(?![\d]|[.,]\d)"
+    return re.search(pattern, html) is not None
+
+
+@dataclass
+class PageCheck:
+    """The outcome of a direct fetch of a page"""
+
+    url: str
+    unchanged: bool = False
+    # The previous extraction, set when the page is unchanged
+    result: Any = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+
+
+@dataclass
+class GateStats:
+    checks: int = 0
+    not_modified: int = 0
+    same_content: int = 0
+    # Same content, but the key fields of the last extraction are not in it
+    stale_content: int = 0
+    fetch_errors: int = 0
+    fetch_seconds: float = 0.0
+    extracts: int = 0
+    extract_seconds: float = 0.0
+
+    @property
+    def skipped(self) -> int:
+        return self.not_modified + self.same_content
+
+    @property
+    def hit_rate(self) -> float:
+        return self.skipped / self.checks if self.checks else 0.0
+
+    @property
+    def saved_seconds(self) -> float:
+        """Extraction time skipped, at the average time of the timed ones"""
+        if not self.extracts:
+            return 0.0
+        return self.skipped * self.extract_seconds / self.extracts
+
+    def __str__(self):
+        average_fetch = self.fetch_seconds / self.checks if self.checks else 0.0
+        saved_time = (
+            f" and ~{self.saved_seconds:.1f}s" if self.extracts and self.skipped else ""
+        )
+        return (
+            f"Fetch gate: {self.checks} checks, {self.hit_rate:.0%} unchanged "
+            f"({self.not_modified} not modified, {self.same_content} same "
+            f"content), {self.stale_content} same content without its key "
+            f"fields, {self.fetch_errors} direct fetches failed, "
+            f"{average_fetch:.2f}s average direct fetch, saved up to "
+            f"~{self.skipped * EXTRACT_CREDITS} credits{saved_time}"
+        )
+
+
+class FetchGate:
+    """
+    Per-URL validators and last extraction of every gated page, shared by
+    all scraping threads.
+
+    Args:
+        path (Path): JSON file the validators and results are stored in
+        max_age_hours (float): Hours an extraction is reused at most
+    """
+
+    def __init__(self, path: Path, max_age_hours: float = MAX_AGE_HOURS):
+        self.path = Path(path)
+        self.max_age = timedelta(hours=max_age_hours)
+        self.stats = GateStats()
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        self._lock = threading.Lock()
+        self._pages = None
+
+    @property
+    def pages(self) -> dict:
+        """The stored pages by URL, loaded on first use"""
+        with self._lock:
+            if self._pages is None:
+                self._pages = {}
+                if self.path.exists():
+                    self._pages = json.loads(self.path.read_text())["pages"]
+            return self._pages
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+    def _reusable(self, url: str) -> Optional[dict]:
+        page = self.pages.get(url)
+        if page is None or "result" not in page:
+            return None
+        extracted_at = datetime.fromisoformat(page["extracted_at"])
+        return page if datetime.utcnow() - extracted_at < self.max_age else None
+
+    def check(self, url: str, key_fields: tuple = ()) -> PageCheck:
+        """
+        Fetch a page directly and compare it with its last extraction. With
+        `key_fields`, a page with the same content is only unchanged if the
+        values of those fields in the last extraction appear in its HTML.
+        """
+        page = self._reusable(url)
+        headers = {}
+        if page is not None and page.get("etag"):
+            headers["If-None-Match"] = page["etag"]
+        if page is not None and page.get("last_modified"):
+            headers["If-Modified-Since"] = page["last_modified"]
+
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            if response.status_code != 304:
+                response.raise_for_status()
+        except requests.RequestException:
+            self._count(checks=1, fetch_errors=1)
+            return PageCheck(url)
+        finally:
+            self._count(fetch_seconds=time.perf_counter() - start)
+
+        if response.status_code == 304 and page is not None:
+            self._count(checks=1, not_modified=1)
+            return PageCheck(
+                url,
+                True,
+                page["result"],
+                page.get("etag"),
+                page.get("last_modified"),
+                page.get("content_hash"),
+            )
+
+        check = PageCheck(
+            url,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            content_hash=content_hash(response.text),
+        )
+        if page is None or page.get("content_hash") != check.content_hash:
+            self._count(checks=1)
+        elif not self._has_key_fields(page["result"], response.text, key_fields):
+            # Likely a challenge page served instead of the product
+            self._count(checks=1, stale_content=1)
+        else:
+            self._count(checks=1, same_content=1)
+            check.unchanged, check.result = True, page["result"]
+        return check
+
+    @staticmethod
+    def _has_key_fields(result: Any, html: str, key_fields: tuple) -> bool:
+        for field in key_fields:
+            value = result.get(field) if isinstance(result, dict) else None
+            # Fields the last extraction found no value for cannot be checked
+            if value is not None and not value_in_html(value, html):
+                return False
+        return True
+
+    def check_many(
+        self, urls: list, workers: int = CHECK_WORKERS, key_fields: tuple = ()
+    ) -> dict:
+        """Check many pages at once, returning their checks by URL"""
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            checks = executor.map(lambda url: self.check(url, key_fields), urls)
+            return dict(zip(urls, checks))
+
+    def record(self, check: PageCheck, result: Any, seconds: Optional[float] = None):
+        """
+        Store the validators of a checked page with a new extraction of it,
+        or count the reuse of its last one. `result` must be JSON serializable.
+        """
+        with self._lock:
+            if check.unchanged:
+                page = self._pages[check.url]
+                page["reused"] = page.get("reused", 0) + 1
+                return
+            self._pages[check.url] = {
+                "etag": check.etag,
+                "last_modified": check.last_modified,
+                "content_hash": check.content_hash,
+                "extracted_at": datetime.utcnow().isoformat(),
+                "result": result,
+            }
+            if seconds is not None:
+                self.stats.extracts += 1
+                self.stats.extract_seconds += seconds
+
+    def get(self, url: str, extract: Callable[[], Any], key_fields: tuple = ()) -> Any:
+        """The last extraction of an unchanged page, or a new one"""
+        check = self.check(url, key_fields)
+        if check.unchanged:
+            self.record(check, check.result)
+            return check.result
+        start = time.perf_counter()
+        result = extract()
+        self.record(check, result, time.perf_counter() - start)
+        return result
+
+    def save(self):
+        """Write the stored pages, replacing the file in one step"""
+        with self._lock:
+            if self._pages is None:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+            tmp_path.write_text(json.dumps({"pages": self._pages}))
+            tmp_path.replace(self.path)
+
+
+@cache
+def get_gate(path: Path) -> Optional[FetchGate]:
+    """
+    The process-wide gate stored at FETCH_GATE_PATH, or at the project's
+    `path`, or None when FETCH_GATE=off
+    """
+    if os.getenv("FETCH_GATE", "on") == "off":
+        return None
+    return FetchGate(os.getenv("FETCH_GATE_PATH") or path)
@@ -0,0 +1,329 @@
+"""
+Firecrawl API client shared by the scrapers in this repository.
+
+It implements the Firecrawl endpoints the scrapers use (`scrape_url`,
+`async_batch_scrape_urls` and `check_batch_scrape_status`, with the same
+arguments and return values as `firecrawl.FirecrawlApp`) on top of a single
+pooled keep-alive `requests.Session`, and adds:
+
+- a process-wide token bucket that keeps scrape requests within the plan's
+  rate limit (FIRECRAWL_REQUESTS_PER_MINUTE)
+- retries with jittered exponential backoff for 429, 5xx and connection
+  errors, honouring Retry-After
+- a circuit breaker that fails fast for a while after repeated failures
+  instead of hammering a degraded API
+- counters for calls, retries, latency and credits used (`client.stats`)
+
+Projects import it by adding this directory to sys.path:
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared"))
+    from firecrawl_client import get_client
+"""
+
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Scrape and batch requests allowed per minute by the Firecrawl plan
+REQUESTS_PER_MINUTE = float(os.getenv("FIRECRAWL_REQUESTS_PER_MINUTE", "100"))
+# Connections kept alive to the API, at least the number of scraping threads
+POOL_SIZE = int(os.getenv("FIRECRAWL_POOL_SIZE", "32"))
+MAX_RETRIES = int(os.getenv("FIRECRAWL_MAX_RETRIES", "3"))
+# Consecutive failed requests that open the circuit, and seconds it stays open
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+REQUEST_TIMEOUT = 120
+
+# Credits of one scraped page, and of one page with LLM extraction
+PAGE_CREDITS = 1
+EXTRACT_CREDITS = 5
+
+# Firecrawl answers 500 for a page that could not be scraped, so only gateway
+# errors and rate limiting are retried
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+# Responses meaning the API itself is degraded, which count towards opening
+# the circuit breaker. Being rate limited is not an outage.
+OUTAGE_STATUS_CODES = {502, 503, 504}
+
+
+class FirecrawlError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(FirecrawlError):
+    """Raised without calling the API while the circuit breaker is open"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. While open, calls
+    fail immediately; after `reset_timeout` seconds one trial call is let
+    through, which closes the circuit again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError while the circuit is open, returning whether
+        the call is the trial call, which must be ended with `end_trial`
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if (
+                time.monotonic() - self._opened_at < self.reset_timeout
+                or self._trial_running
+            ):
+                raise CircuitOpenError("Firecrawl circuit breaker is open")
+            self._trial_running = True
+            return True
+
+    def end_trial(self):
+        """
+        Let the next call be a trial again, so a trial that ended without a
+        success or failure being recorded does not keep the circuit open
+        """
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+@dataclass
+class ClientStats:
+    calls: int = 0
+    retries: int = 0
+    failures: int = 0
+    rejected: int = 0
+    credits_used: int = 0
+    total_latency: float = 0.0
+
+    @property
+    def average_latency(self) -> float:
+        return self.total_latency / self.calls if self.calls else 0.0
+
+    def __str__(self):
+        return (
+            f"Firecrawl: {self.calls} calls, {self.retries} retries, "
+            f"{self.failures} failed, {self.rejected} rejected by the circuit "
+            f"breaker, {self.average_latency:.2f}s average latency, "
+            f"~{self.credits_used} credits"
+        )
+
+
+class FirecrawlClient:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        api_url: Optional[str] = None,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        pool_size: int = POOL_SIZE,
+        max_retries: int = MAX_RETRIES,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+    ):
+        self.api_key = api_key or os.getenv("FIRECRAWL_API_KEY")
+        self.api_url = api_url or os.getenv(
+            "FIRECRAWL_API_URL", "https://api.firecrawl.dev"
+        )
+        if "api.firecrawl.dev" in self.api_url and self.api_key is None:
+            raise ValueError("No API key provided")
+
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = ClientStats()
+        self._stats_lock = threading.Lock()
+        self._bucket = TokenBucket(requests_per_minute / 60, capacity=1)
+        self._breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._counted_jobs = set()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.api_key}",
+            }
+        )
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, value in increments.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+    def _backoff(self, attempt: int, response=None) -> float:
+        retry_after = response is not None and response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        # Full jitter, so parallel scrapers do not retry in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _request(self, method: str, url: str, json=None) -> Dict[str, Any]:
+        if not url.startswith("http"):
+            url = f"{self.api_url}{url}"
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                trial = self._breaker.before_call()
+            except CircuitOpenError:
+                self._count(rejected=1)
+                raise
+            try:
+                if method == "POST":
+                    self._bucket.acquire()
+
+                start = time.perf_counter()
+                response, error = None, None
+                try:
+                    response = self.session.request(
+                        method, url, json=json, timeout=REQUEST_TIMEOUT
+                    )
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                self._count(calls=1, total_latency=time.perf_counter() - start)
+
+                # Neither a bad request, a page that failed to scrape (500) nor
+                # being rate limited means the API itself is degraded
+                if response is None or response.status_code in OUTAGE_STATUS_CODES:
+                    self._breaker.record_failure()
+                else:
+                    self._breaker.record_success()
+            finally:
+                # Any other exception still ends the trial
+                if trial:
+                    self._breaker.end_trial()
+
+            if response is not None and response.status_code not in RETRY_STATUS_CODES:
+                return self._parse(response)
+
+            if attempt == self.max_retries:
+                break
+            self._count(retries=1)
+            time.sleep(self._backoff(attempt, response))
+
+        self._count(failures=1)
+        if response is None:
+            raise FirecrawlError(f"Firecrawl request failed: {error}")
+        return self._parse(response)
+
+    def _parse(self, response) -> Dict[str, Any]:
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        if response.status_code >= 400 or payload.get("success") is False:
+            error = payload.get("error") or response.text or "No error details"
+            raise FirecrawlError(
+                f"Firecrawl returned {response.status_code}: {error}",
+                response.status_code,
+            )
+        return payload
+
+    def scrape_url(self, url: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """Scrape a single URL and return its document"""
+        params = params or {}
+        response = self._request("POST", "/v1/scrape", {"url": url, **params})
+        credits = EXTRACT_CREDITS if "extract" in params else PAGE_CREDITS
+        self._count(credits_used=credits)
+        return response["data"]
+
+    def async_batch_scrape_urls(
+        self, urls: list, params: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Start a batch scrape job, returning its id"""
+        return self._request(
+            "POST", "/v1/batch/scrape", {"urls": urls, **(params or {})}
+        )
+
+    def check_batch_scrape_status(self, id: str) -> Dict[str, Any]:
+        """Get the status of a batch scrape job and, once done, all its documents"""
+        status = self._request("GET", f"/v1/batch/scrape/{id}")
+        if status.get("status") == "completed":
+            data = list(status.get("data") or [])
+            next_url = status.get("next")
+            while next_url:
+                page = self._request("GET", next_url)
+                data.extend(page.get("data") or [])
+                next_url = page.get("next")
+            status["data"] = data
+            if id not in self._counted_jobs:
+                self._counted_jobs.add(id)
+                self._count(credits_used=status.get("creditsUsed") or 0)
+        return status
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> FirecrawlClient:
+    """The process-wide client, so every scraper shares its pool and limits"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = FirecrawlClient()
+        return _client
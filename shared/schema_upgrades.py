@@ -0,0 +1,58 @@
+"""
+In-place schema upgrades shared by the projects' setup steps.
+
+`upgrade_schema` creates missing tables, adds the columns introduced after a
+table was first created and creates missing indexes. Added columns must be
+nullable or have a server default, so existing rows stay valid; other new
+columns are skipped with a warning and need a migration of their own.
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared"))
+    from schema_upgrades import upgrade_schema
+"""
+
+from sqlalchemy import inspect, text
+
+
+def _column_definition(column, dialect) -> str:
+    definition = f"{column.name} {column.type.compile(dialect)}"
+    if column.server_default is not None:
+        definition += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            definition += " NOT NULL"
+    return definition
+
+
+def upgrade_schema(engine, metadata):
+    """
+    Create the missing tables of `metadata` and add their missing columns and
+    indexes. Returns the names of the columns that could not be added.
+    """
+    metadata.create_all(engine)
+    inspector = inspect(engine)
+    skipped = []
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                name = f"{table.name}.{column.name}"
+                if not column.nullable and column.server_default is None:
+                    # Existing rows would have no value for it
+                    print(f"Skipped column {name}: NOT NULL without a default")
+                    skipped.append(name)
+                    continue
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table.name} "
+                        f"ADD COLUMN {_column_definition(column, engine.dialect)}"
+                    )
+                )
+                print(f"Added column {name}")
+
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+                    print(f"Created index {index.name}")
+    return skipped
@@ -0,0 +1,354 @@
+"""
+Per-domain selector templates learned from Firecrawl's LLM extraction.
+
+After a page has been scraped with an `extract` call, `SelectorTemplates.learn`
+looks for the extracted values in the page's HTML and stores an XPath for each
+schema field, keyed by the page's domain. Later pages of the same domain are
+fetched as raw HTML only and `SelectorTemplates.extract` reads the fields with
+those XPaths, which takes milliseconds instead of an LLM call. When the result
+fails schema validation or looks implausible, `extract` returns None and the
+caller falls back to an LLM extract, which learns the template again.
+
+Templates are stored in a `selector_templates` table of the project's database,
+created by `create_table` in the project's setup step. They need lxml; without
+it `enabled` is False and every page is LLM-extracted.
+"""
+
+import importlib.util
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import (
+    JSON,
+    Column,
+    DateTime,
+    MetaData,
+    String,
+    Table,
+    delete,
+    insert,
+    select,
+)
+
+# lxml is imported when a page is parsed, so importing the scrapers stays fast
+LXML_INSTALLED = importlib.util.find_spec("lxml") is not None
+
+# A templated price further than this fraction from the expected price is
+# confirmed by an LLM extract
+MAX_PRICE_CHANGE = 0.5
+
+# Attributes that name an element for its content rather than its styling
+NAMING_ATTRIBUTES = ["itemprop", "property", "name", "data-testid"]
+# Attributes a field's value can be read from
+VALUE_ATTRIBUTES = ["content", "src", "href", "value", "data-src"]
+
+SKIPPED_TAGS = {"script", "style", "head", "html", "body"}
+
+NUMBER_PATTERN = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?")
+
+metadata = MetaData()
+
+selector_templates = Table(
+    "selector_templates",
+    metadata,
+    Column("schema", String(100), primary_key=True),
+    Column("domain", String(255), primary_key=True),
+    # {field: {"xpath": ..., "attribute": ... or None} or {"value": ...}}
+    Column("fields", JSON, nullable=False),
+    Column("learned_at", DateTime, nullable=False),
+)
+
+
+def get_domain(url: str) -> str:
+    netloc = urlparse(url).netloc.lower().split(":")[0]
+    return netloc[4:] if netloc.startswith("www.") else netloc
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def parse_number(text: str) -> Optional[float]:
+    """The number in a text like "$1,299.99", None unless it holds exactly one"""
+    numbers = NUMBER_PATTERN.findall(text)
+    if len(numbers) != 1:
+        return None
+    return float(numbers[0].replace(",", ""))
+
+
+def _matches(text: Optional[str], value) -> bool:
+    if text is None:
+        return False
+    if isinstance(value, (int, float)):
+        number = parse_number(text)
+        return number is not None and abs(number - value) < 0.005
+    return normalize_text(text).casefold() == normalize_text(str(value)).casefold()
+
+
+def _read(element, attribute: Optional[str]) -> Optional[str]:
+    if attribute:
+        return element.get(attribute)
+    return element.text_content()
+
+
+def _candidate_xpaths(element):
+    """XPaths that select the element, from the most to the least stable"""
+    tag = element.tag
+    for attribute in ["id"] + NAMING_ATTRIBUTES:
+        value = element.get(attribute)
+        if value and '"' not in value:
+            yield f'//{tag}[@{attribute}="{value}"]'
+    for css_class in (element.get("class") or "").split():
+        if '"' not in css_class:
+            yield (
+                f'//{tag}[contains(concat(" ", normalize-space(@class), " "), '
+                f'" {css_class} ")]'
+            )
+    yield element.getroottree().getpath(element)
+
+
+def _value_elements(tree, value):
+    """(element, attribute) pairs holding the value, attributes first"""
+    from lxml import etree
+
+    # Meta tags and structured data survive redesigns better than visible text
+    for element in tree.iter(tag=etree.Element):
+        for attribute in VALUE_ATTRIBUTES:
+            if _matches(element.get(attribute), value):
+                yield element, attribute
+
+    # The innermost element whose text is the value, found by walking up a
+    # few levels from each piece of text, since a value is often split up
+    # like <span>$1,299<sup>.99</sup></span>
+    seen = []
+    for element in tree.iter(tag=etree.Element):
+        if element.tag in SKIPPED_TAGS or not (element.text or "").strip():
+            continue
+        for _ in range(3):
+            if element is None or element.tag in SKIPPED_TAGS or element in seen:
+                break
+            if _matches(element.text_content(), value):
+                seen.append(element)
+                yield element, None
+                break
+            element = element.getparent()
+
+
+def _parse(page_html: Optional[str]):
+    from lxml import etree, html
+
+    if not page_html or not page_html.strip():
+        return None
+    try:
+        return html.fromstring(page_html)
+    except etree.LxmlError:
+        return None
+
+
+def _select(tree, xpath: str) -> list:
+    from lxml import etree
+
+    try:
+        return tree.xpath(xpath)
+    except etree.XPathError:
+        return []
+
+
+def _learn_field(tree, value) -> Optional[dict]:
+    for element, attribute in _value_elements(tree, value):
+        for xpath in _candidate_xpaths(element):
+            found = _select(tree, xpath)
+            # Extraction reads the first element the XPath selects
+            if found and _matches(_read(found[0], attribute), value):
+                return {"xpath": xpath, "attribute": attribute}
+    return None
+
+
+class SelectorTemplates:
+    """
+    Learned templates of one extraction schema, e.g. a scraper's `Product`
+    model, loaded into memory and shared by all scraping threads.
+
+
+    Args:
+        engine: SQLAlchemy engine of the database storing the templates
+        model: Pydantic model of the extracted data
+        url_field: Model field set to the scraped URL rather than read from
+            the page
+        fixed_fields: Model fields the LLM may infer rather than read, like a
+            currency shown as "$". When the page does not contain their value
+            it is stored as a constant of the domain.
+    """
+
+    def __init__(
+        self,
+        engine,
+        model: type[BaseModel],
+        url_field: Optional[str] = None,
+        fixed_fields: tuple = (),
+    ):
+        self.engine = engine
+        self.model = model
+        self.url_field = url_field
+        self.fixed_fields = fixed_fields
+        self.schema = model.__name__
+        self.hits = self.misses = self.learned = 0
+        self.parse_seconds = 0.0
+        self._lock = threading.Lock()
+        self._loaded = None
+
+    @property
+    def enabled(self) -> bool:
+        return LXML_INSTALLED
+
+    def create_table(self):
+        metadata.create_all(self.engine)
+
+    @property
+    def _templates(self) -> dict:
+        """The stored templates, loaded on first use"""
+        with self._lock:
+            if self._loaded is None:
+                with self.engine.connect() as connection:
+                    rows = connection.execute(
+                        select(
+                            selector_templates.c.domain, selector_templates.c.fields
+                        ).where(selector_templates.c.schema == self.schema)
+                    )
+                    self._loaded = {row.domain: row.fields for row in rows}
+            return self._loaded
+
+    def has(self, url: str) -> bool:
+        return self.enabled and get_domain(url) in self._templates
+
+    def _required_fields(self):
+        return [
+            name
+            for name, field in self.model.model_fields.items()
+            if field.is_required() and name != self.url_field
+        ]
+
+    def learn(self, url: str, page_html: Optional[str], data: dict) -> bool:
+        """
+        Learn the template of the URL's domain from a page and the values an
+        LLM extracted from it. Only templates that find every required field
+        are stored, and only written when they changed.
+        """
+        tree = _parse(page_html) if self.enabled else None
+        if tree is None:
+            return False
+        fields = {}
+        for name in self.model.model_fields:
+            value = data.get(name)
+            if name == self.url_field or isinstance(value, bool) or value is None:
+                continue
+            rule = _learn_field(tree, value)
+            if rule is None and name in self.fixed_fields:
+                rule = {"value": value}
+            if rule is not None:
+                fields[name] = rule
+        if any(name not in fields for name in self._required_fields()):
+            return False
+
+        domain = get_domain(url)
+        templates = self._templates
+        with self._lock:
+            if templates.get(domain) == fields:
+                return True
+            templates[domain] = fields
+            self.learned += 1
+        key = (selector_templates.c.schema == self.schema) & (
+            selector_templates.c.domain == domain
+        )
+        with self.engine.begin() as connection:
+            connection.execute(delete(selector_templates).where(key))
+            connection.execute(
+                insert(selector_templates).values(
+                    schema=self.schema,
+                    domain=domain,
+                    fields=fields,
+                    learned_at=datetime.utcnow(),
+                )
+            )
+        return True
+
+    def extract(
+        self,
+        url: str,
+        page_html: Optional[str],
+        expected: Optional[Dict[str, float]] = None,
+    ) -> Optional[dict]:
+        """
+        Extract a page with its domain's template. Returns None, so the caller
+        falls back to an LLM extract, when the values fail validation, a
+        number is not positive or a number is more than MAX_PRICE_CHANGE away
+        from its `expected` value.
+        """
+        fields = self._templates.get(get_domain(url))
+        if fields is None:
+            return None
+
+        start = time.perf_counter()
+        data = self._apply(url, page_html, fields)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.parse_seconds += elapsed
+            if data is not None:
+                for name, value in (expected or {}).items():
+                    if (
+                        value
+                        and abs(data.get(name, 0) - value) / value > MAX_PRICE_CHANGE
+                    ):
+                        data = None
+                        break
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def _apply(self, url: str, page_html: str, fields: dict) -> Optional[dict]:
+        tree = _parse(page_html)
+        if tree is None:
+            return None
+        values = {self.url_field: url} if self.url_field else {}
+        for name, rule in fields.items():
+            if "value" in rule:
+                values[name] = rule["value"]
+                continue
+            found = _select(tree, rule["xpath"])
+            text = _read(found[0], rule["attribute"]) if found else None
+            if text is None:
+                continue
+            annotation = self.model.model_fields[name].annotation
+            if annotation in (int, float):
+                values[name] = parse_number(text)
+            else:
+                values[name] = normalize_text(text)
+
+        try:
+            data = self.model.model_validate(values).model_dump()
+        except ValidationError:
+            return None
+        if any(
+            isinstance(value, (int, float))
+            and not isinstance(value, bool)
+            and value <= 0
+            for value in data.values()
+        ):
+            return None
+        return data
+
+    def __str__(self):
+        pages = self.hits + self.misses
+        average = self.parse_seconds / pages * 1000 if pages else 0
+        return (
+            f"Selector templates: {self.hits} pages extracted locally, "
+            f"{self.misses} fell back to LLM extraction, {self.learned} learned, "
+            f"{average:.1f}ms average parse time"
+        )
@@ -0,0 +1,60 @@
+"""
+Tests of the fetch gate's reuse of unchanged pages.
+
+    python -m pytest shared
+"""
+
+import requests
+
+from fetch_gate import FetchGate, value_in_html
+
+URL = "https://shop.test/product"
+PRODUCT_PAGE = "<html><h1>Widget</h1><span class='price'>$1,299.00</span></html>"
+CHALLENGE_PAGE = "<html><h1>Checking your browser...</h1></html>"
+
+
+class PageSession:
+    """Answers every request with the HTML in `page` and a 200"""
+
+    def __init__(self, page: str):
+        self.page = page
+
+    def get(self, *args, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = self.page.encode()
+        return response
+
+
+def gated_page(tmp_path, page: str) -> FetchGate:
+    """A gate whose last extraction of URL was made from `page`"""
+    gate = FetchGate(tmp_path / "fetch_gate.json")
+    gate.session = PageSession(page)
+    gate.get(URL, lambda: {"name": "Widget", "price": 1299.0})
+    return gate
+
+
+def test_same_content_with_key_fields_is_reused(tmp_path):
+    gate = gated_page(tmp_path, PRODUCT_PAGE)
+    check = gate.check(URL, ("price",))
+
+    assert check.unchanged and check.result["price"] == 1299.0
+    assert gate.stats.same_content == 1
+
+
+def test_challenge_page_is_extracted_again(tmp_path):
+    # Firecrawl got past the challenge that the direct fetch was shown
+    gate = gated_page(tmp_path, CHALLENGE_PAGE)
+    assert gate.check(URL).unchanged
+
+    check = gate.check(URL, ("price",))
+    assert not check.unchanged
+    assert gate.stats.stale_content == 1
+
+
+def test_value_in_html_formats():
+    assert value_in_html(1299.0, "$1,299")
+    assert value_in_html(1299.0, "1.299,00 EUR")
+    assert value_in_html(19.99, '"price": "19.99"')
+    assert not value_in_html(19.99, "$119.99")
+    assert not value_in_html(473.0, "$473.50")
@@ -0,0 +1,84 @@
+"""
+Circuit breaker tests of the shared Firecrawl client.
+
+    python -m pytest shared
+"""
+
+import json
+import time
+
+import pytest
+import requests
+
+from firecrawl_client import CircuitOpenError, FirecrawlClient, FirecrawlError
+
+RESET_TIMEOUT = 0.05
+
+
+def make_response(status_code: int) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(
+        {"success": True, "data": {}}
+        if status_code == 200
+        else {"success": False, "error": "error"}
+    ).encode()
+    return response
+
+
+class ScriptedSession:
+    """Answers requests with the given status codes or exceptions, in order"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, *args, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return make_response(outcome)
+
+
+def open_circuit(outcome) -> FirecrawlClient:
+    """A client whose circuit was opened and whose trial call gets `outcome`"""
+    client = FirecrawlClient(
+        api_url="http://firecrawl.test",
+        requests_per_minute=1e6,
+        max_retries=0,
+        failure_threshold=2,
+        reset_timeout=RESET_TIMEOUT,
+    )
+    client.session = ScriptedSession(503, 503, outcome, 200)
+    for _ in range(2):
+        with pytest.raises(FirecrawlError):
+            client.scrape_url("https://example.com")
+    with pytest.raises(CircuitOpenError):
+        client.scrape_url("https://example.com")
+    time.sleep(RESET_TIMEOUT)
+    return client
+
+
+@pytest.mark.parametrize(
+    "outcome", [500, 429, requests.exceptions.ChunkedEncodingError("truncated")]
+)
+def test_trial_without_outage_lets_next_call_through(outcome):
+    client = open_circuit(outcome)
+    with pytest.raises(Exception) as raised:
+        client.scrape_url("https://example.com")
+    assert not isinstance(raised.value, CircuitOpenError)
+
+    assert client.scrape_url("https://example.com") == {}
+    assert client.session.calls == 4
+
+
+def test_failed_trial_opens_circuit_again():
+    client = open_circuit(503)
+    with pytest.raises(FirecrawlError):
+        client.scrape_url("https://example.com")
+    with pytest.raises(CircuitOpenError):
+        client.scrape_url("https://example.com")
+
+    time.sleep(RESET_TIMEOUT)
+    assert client.scrape_url("https://example.com") == {}